@@ -0,0 +1,185 @@
+"""Provides aggregates over the completion histories of habits, vectorized with numpy if it is installed."""
+from typing import Any, Optional
+from bisect import bisect_left
+from datetime import datetime
+from functools import cache
+
+from habit import Habit, PeriodLength, period_index, to_epoch
+
+DAY = 24 * 60 * 60
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# Can be unset to always use the pure Python implementation
+USE_NUMPY = True
+
+@cache
+def find_numpy() -> Optional[Any]:
+    """Helper method importing numpy once, None if it is not installed."""
+    try:
+        # NOTE: Imported when needed, as it is slow to import.
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def numpy() -> Optional[Any]:
+    """Returns the numpy module, None if it is not installed or USE_NUMPY is unset."""
+    return find_numpy() if USE_NUMPY else None
+
+class History:
+    """
+    Aggregates over the completion histories of habits, for the last weeks weeks.
+
+    Days and weeks are counted like period_index, weeks start on Monday.
+    A daily habit is expected to be completed on every day of a week,
+    a weekly habit once, but only from its creation up to today.
+    Completing a daily habit several times on one day counts once.
+
+    With numpy all completions are packed into arrays of (habit index, epoch)
+    and counted with bincount, otherwise the same is done in pure Python.
+
+    Attributes
+    ----------
+    habits: list[Habit]
+        The habits, which must have their full history.
+    weeks: int
+        Number of weeks looked at, ending with the current one.
+    first_day: int
+        Days since 1970-01-01 of the Monday of the first week looked at.
+    today: int
+        Days since 1970-01-01 of now.
+    week_rates: list[Optional[float]]
+        Completed over expected periods of all habits per week, oldest first.
+        None if no period was expected.
+    habit_rates: list[Optional[float]]
+        Completed over expected periods per habit, over all weeks.
+        None if no period was expected.
+    weekday_counts: list[int]
+        Number of completions per day of the week (Monday first), over the whole history.
+
+    Methods
+    -------
+    best_weekday() -> Optional[int]
+    heatmap(i: int) -> list[list[int]]
+    """
+    habits: list[Habit]
+    weeks: int
+    first_day: int
+    today: int
+    week_rates: list[Optional[float]]
+    habit_rates: list[Optional[float]]
+    weekday_counts: list[int]
+
+    def __init__(self, habits: list[Habit], weeks: int = 12, now: Optional[datetime] = None):
+        """
+        Computes all aggregates of habits.
+        """
+        if now is None:
+            now = datetime.now()
+        self.habits = habits
+        self.weeks = weeks
+        self.today = period_index(to_epoch(now), PeriodLength.daily)
+        self.first_day = 7 * (period_index(to_epoch(now), PeriodLength.weekly) - weeks + 1) - 3
+        np = numpy()
+        if np is not None:
+            self.compute_numpy(np)
+        else:
+            self.compute_python()
+
+    def compute_numpy(self, np: Any):
+        """Helper method computing the aggregates with numpy."""
+        n, w = len(self.habits), self.weeks
+        span = 7 * w
+        blocks = [np.frombuffer(h.completed_times.epochs, dtype=np.int64)
+                  for h in self.habits if len(h.completed_times) > 0]
+        epochs = np.concatenate(blocks) if blocks else np.empty(0, dtype=np.int64)
+        lengths = np.fromiter((len(h.completed_times) for h in self.habits), dtype=np.int64, count=n)
+        idx = np.repeat(np.arange(n, dtype=np.int64), lengths)
+
+        days = epochs // DAY
+        self.weekday_counts = np.bincount((days + 3) % 7, minlength=7).tolist()
+
+        # Distinct (habit, day) pairs inside the weeks looked at
+        sel = (days >= self.first_day) & (days <= self.today)
+        pairs = np.unique(idx[sel] * span + (days[sel] - self.first_day))
+        done = np.bincount((pairs // span) * w + (pairs % span) // 7, minlength=n * w).reshape(n, w)
+
+        daily = np.fromiter((h.period_length == PeriodLength.daily for h in self.habits), dtype=bool, count=n)
+        created = np.fromiter((period_index(to_epoch(h.creation_date), PeriodLength.daily)
+                               for h in self.habits), dtype=np.int64, count=n)
+        starts = self.first_day + 7 * np.arange(w, dtype=np.int64)
+        lo = np.maximum(starts[None, :], created[:, None])
+        hi = np.minimum(starts + 6, self.today)[None, :]
+        days_expected = np.clip(hi - lo + 1, 0, None)
+        expected = np.where(daily[:, None], days_expected, days_expected > 0)
+        done = np.minimum(np.where(daily[:, None], done, np.minimum(done, 1)), expected)
+
+        self.week_rates = [None if e == 0 else d / e
+                           for d, e in zip(done.sum(axis=0).tolist(), expected.sum(axis=0).tolist())]
+        self.habit_rates = [None if e == 0 else d / e
+                            for d, e in zip(done.sum(axis=1).tolist(), expected.sum(axis=1).tolist())]
+
+    def compute_python(self):
+        """Helper method computing the aggregates in pure Python."""
+        w = self.weeks
+        self.weekday_counts = [0] * 7
+        week_done = [0] * w
+        week_expected = [0] * w
+        self.habit_rates = []
+        for h in self.habits:
+            epochs = h.completed_times.epochs
+            for e in epochs:
+                self.weekday_counts[(e // DAY + 3) % 7] += 1
+            # Completions are sorted, so only the ones looked at are visited
+            seen: set[int] = set()
+            for e in epochs[bisect_left(epochs, self.first_day * DAY):]:
+                day = e // DAY
+                if day > self.today:
+                    break
+                seen.add(day)
+            done = [0] * w
+            for day in seen:
+                done[(day - self.first_day) // 7] += 1
+
+            daily = h.period_length == PeriodLength.daily
+            created = period_index(to_epoch(h.creation_date), PeriodLength.daily)
+            habit_done = habit_expected = 0
+            for k in range(w):
+                start = self.first_day + 7 * k
+                days_expected = max(min(start + 6, self.today) - max(start, created) + 1, 0)
+                expected = days_expected if daily else int(days_expected > 0)
+                d = min(done[k] if daily else min(done[k], 1), expected)
+                week_done[k] += d
+                week_expected[k] += expected
+                habit_done += d
+                habit_expected += expected
+            self.habit_rates.append(None if habit_expected == 0 else habit_done / habit_expected)
+        self.week_rates = [None if e == 0 else d / e for d, e in zip(week_done, week_expected)]
+
+    def best_weekday(self) -> Optional[int]:
+        """
+        Returns the day of the week (0 is Monday) with the most completions,
+        None if there are none. See WEEKDAYS.
+        """
+        best = max(range(7), key=lambda d: self.weekday_counts[d])
+        return best if self.weekday_counts[best] > 0 else None
+
+    def heatmap(self, i: int) -> list[list[int]]:
+        """
+        Returns the number of completions of the habit self.habits[i]
+        per week (oldest first) and day of the week (Monday first).
+        """
+        epochs = self.habits[i].completed_times.epochs
+        begin = bisect_left(epochs, self.first_day * DAY)
+        np = numpy()
+        if np is not None and begin < len(epochs):
+            days = np.frombuffer(epochs, dtype=np.int64)[begin:] // DAY - self.first_day
+            counts = np.bincount(days[days < 7 * self.weeks], minlength=7 * self.weeks)
+            return counts.reshape(self.weeks, 7).tolist()
+        grid = [[0] * 7 for _ in range(self.weeks)]
+        for e in epochs[begin:]:
+            day = e // DAY - self.first_day
+            if day >= 7 * self.weeks:
+                break
+            grid[day // 7][day % 7] += 1
+        return grid
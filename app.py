@@ -1,11 +1,15 @@
 """This module provides the main logic of the habit tracker."""
 from typing import Optional
+from collections.abc import Iterable
 from datetime import datetime
 import sys
 
-from habit import Habit, PeriodLength
-from storage import StorageInterface, StorageKind, OrgStorage
+from habit import Habit, PeriodLength, period_index, to_epoch
+from storage import StorageInterface, StorageKind, OrgStorage, SqliteStorage, BinaryStorage
+from leaderboard import Leaderboard
+from analytics import DAY, History
 from log import log
+from timing import timed
 
 def streak(h: Habit):
     """Helper method for getting streak length for max function"""
@@ -17,6 +21,97 @@ def lstreak(h: Habit) -> int:
         return 0
     return h.longest_streak.length
 
+def current_periods(now: Optional[int] = None) -> dict[PeriodLength, int]:
+    """
+    Returns the period_index of now (see to_epoch, datetime.now() if not given)
+    for every PeriodLength.
+    """
+    if now is None:
+        now = to_epoch(datetime.now())
+    return {p: period_index(now, p) for p in PeriodLength}
+
+def rollover(h: Habit, current: dict[PeriodLength, int]) -> bool:
+    """
+    Updates h if a new period started since it was last completed.
+    current is the result of current_periods().
+    Returns True if h changed.
+    """
+    # If streak == 0, not completed and thus do nothing
+    if h.streak_length == 0:
+        return False
+    last = h.last_period()
+    if last is None:
+        return False
+    cur = current[h.period_length]
+    if last >= cur:
+        return False
+    # New week/day
+    # Was completed and thus streak already increased by 1
+    # and completed_times was already added,
+    # so only set to False
+    changed = h.completed
+    h.completed = False
+    if last + 1 < cur:
+        # A whole period was missed, so reset streak
+        h.streak_length = 0
+        changed = True
+    return changed
+
+class Analytics:
+    """
+    The aggregates shown on the analytics page, computed in a single pass over the habits.
+
+    Attributes
+    ----------
+    total: int
+        Number of habits.
+    completed: int
+        Number of habits completed in the current period.
+    daily: int
+        Number of daily habits.
+    weekly: int
+        Number of weekly habits.
+    current_longest: dict[Optional[PeriodLength], Optional[Habit]]
+        The habit with the longest ongoing streak, overall (None) and per PeriodLength.
+    longest_ever: dict[Optional[PeriodLength], Optional[Habit]]
+        The habit with the longest streak recorded, overall (None) and per PeriodLength.
+    """
+    total: int
+    completed: int
+    daily: int
+    weekly: int
+    current_longest: dict[Optional[PeriodLength], Optional[Habit]]
+    longest_ever: dict[Optional[PeriodLength], Optional[Habit]]
+
+    def __init__(self, habits: list[Habit]):
+        """
+        Computes all aggregates of habits.
+        Like max, the first habit wins on ties.
+        """
+        self.total = len(habits)
+        self.completed = 0
+        self.daily = 0
+        self.weekly = 0
+        self.current_longest = {None: None, PeriodLength.daily: None, PeriodLength.weekly: None}
+        self.longest_ever = {None: None, PeriodLength.daily: None, PeriodLength.weekly: None}
+        cur = self.current_longest
+        ever = self.longest_ever
+        for h in habits:
+            if h.completed:
+                self.completed += 1
+            p = h.period_length
+            if p == PeriodLength.daily:
+                self.daily += 1
+            else:
+                self.weekly += 1
+            for k in (None, p):
+                c = cur[k]
+                if c is None or streak(h) > streak(c):
+                    cur[k] = h
+                e = ever[k]
+                if e is None or lstreak(h) > lstreak(e):
+                    ever[k] = h
+
 class HabitTracker:
     """
     The state of the app.
@@ -28,19 +123,50 @@ class HabitTracker:
     storage: StorageInterface
         Handles read and save of habits.
         See 'help(StorageInterface)' for more information.
+    lazy: bool
+        If set, only habit headers are read and completion histories
+        are loaded from storage when needed.
+    partial: set[str]
+        Names of habits whose completion history has not been loaded yet.
+    by_name: dict[str, Habit]
+        Index of habits by name, the handle the Tui and cli use to refer to habits.
+    version: int
+        Incremented on every change to the habits, used to invalidate cached analytics.
+    leaderboards: dict[tuple[bool, Optional[PeriodLength]], Leaderboard]
+        Rankings of habit names by streak, keyed by (all-time, period).
+        all-time False ranks by streak_length, True by longest_streak.
+        period None ranks all habits, otherwise only the habits of that PeriodLength.
+    next_rollover: int
+        The epoch (see to_epoch) of the next midnight, before which update has nothing to do.
+    buckets: dict[PeriodLength, dict[int, set[str]]]
+        Names of the habits with a streak, by PeriodLength and period_index of their last completion,
+        so update only looks at the habits whose period ended. See schedule.
+    bucket_of: dict[str, tuple[PeriodLength, int]]
+        The bucket every habit in buckets is in.
+
+    Assigning to habits rebuilds all indexes.
 
     Methods
     -------
     read()
     save()
+    close()
     read_from(file: str) !! Not Implemented Yet !!
     save_as(file: str) !! Not Implemented Yet !!
     get_completed_str() -> list[str]
     get_uncompleted_str() -> list[str]
     complete(n: str)
+    complete_many(records: Iterable[tuple[str, datetime]]) -> int
     addHabit(name: str, symbol: str, period_length: PeriodLength)
     deleteHabit(n: str)
     getHabit(n: str) -> Optional[Habit]
+    load_history(h: Habit)
+    analytics() -> Analytics
+    history(weeks: int = 12) -> History
+    heatmap(h: Habit, weeks: int = 12) -> list[list[int]]
+    rank(h: Habit)
+    topStreaks(n: int, period: Optional[PeriodLength] = None) -> list[Habit]
+    topLongestStreaks(n: int, period: Optional[PeriodLength] = None) -> list[Habit]
     nrDailyHabits() -> int
     nrWeeklyHabits() -> int
     currentLongestStreak() -> str
@@ -54,33 +180,121 @@ class HabitTracker:
     check_names_unique() -> bool
     check_name_unique(n: str) -> bool
     update()
+    schedule(h: Habit)
+    unschedule(name: str)
     """
-    habits: list[Habit] = list()
+    _habits: list[Habit]
+    by_name: dict[str, Habit]
+    version: int = 0
+    _analytics: Optional[Analytics] = None
+    _analytics_version: int = -1
+    _history: Optional[History] = None
+    _history_key: tuple[int, int, int] = (-1, 0, 0)
+    leaderboards: dict[tuple[bool, Optional[PeriodLength]], Leaderboard]
+    next_rollover: int = 0
+    buckets: dict[PeriodLength, dict[int, set[str]]]
+    bucket_of: dict[str, tuple[PeriodLength, int]]
     storage: StorageInterface
+    lazy: bool = False
+    partial: set[str]
 
-    def __init__(self, store_kind: StorageKind, file: Optional[str] = None):
+    def __init__(self, store_kind: StorageKind, file: Optional[str] = None, journal: bool = False,
+                 lazy: bool = False, backup: bool = False, cache: bool = False):
         """
         App constructor
 
         Takes in a StorageKind and a file if needed to use as primary storage implementation.
+        If journal is set, changes are appended to a journal instead of rewriting the file
+        on every save (only supported by StorageKind.org).
+        If lazy is set, completion histories are only read when needed.
+        If backup is set, the previous file is kept as 'bk.<file>' when it is rewritten
+        (only supported by StorageKind.org).
+        If cache is set, a binary snapshot '<file>.bin' is read instead of the file
+        while it is up to date (only supported by StorageKind.org).
         """
         # TODO: Exceptions
+        self.habits = list()
+        self.lazy = lazy
+        self.partial = set()
         if store_kind == StorageKind.org:
             if file:
-                self.storage = OrgStorage(file)
+                self.storage = OrgStorage(file, journal, backup=backup, cache=cache)
             else:
                 print("OrgStorage requires a file")
                 return
+        elif store_kind == StorageKind.sqlite:
+            if file:
+                self.storage = SqliteStorage(file)
+            else:
+                print("SqliteStorage requires a file")
+                return
+        elif store_kind == StorageKind.binary:
+            if file:
+                self.storage = BinaryStorage(file)
+            else:
+                print("BinaryStorage requires a file")
+                return
         else:
             print("Unknown StorageKind")
             return
         self.read()
 
+    @property
+    def habits(self) -> list[Habit]:
+        return self._habits
+
+    @habits.setter
+    def habits(self, habits: list[Habit]):
+        self._habits = habits
+        self.by_name = {h.name: h for h in habits}
+        self.version += 1
+        self.leaderboards = {}
+        for ever in (False, True):
+            score = lstreak if ever else streak
+            for p in (None, PeriodLength.daily, PeriodLength.weekly):
+                self.leaderboards[(ever, p)] = Leaderboard({h.name: score(h) for h in habits
+                                                            if p is None or h.period_length == p})
+        self.buckets = {p: {} for p in PeriodLength}
+        self.bucket_of = {}
+        for h in habits:
+            self.schedule(h)
+        # The new habits may not be up to date
+        self.next_rollover = 0
+
+    def schedule(self, h: Habit):
+        """
+        Moves h to the bucket of the period of its last completion,
+        or out of buckets if it has no streak that could end.
+        """
+        self.unschedule(h.name)
+        last = h.last_period()
+        if h.streak_length == 0 or last is None:
+            return
+        self.buckets[h.period_length].setdefault(last, set()).add(h.name)
+        self.bucket_of[h.name] = (h.period_length, last)
+
+    def unschedule(self, name: str):
+        """
+        Removes the habit called name from buckets.
+        """
+        key = self.bucket_of.pop(name, None)
+        if key is None:
+            return
+        bucket = self.buckets[key[0]][key[1]]
+        bucket.discard(name)
+        if not bucket:
+            del self.buckets[key[0]][key[1]]
+
     def read(self):
         """
         Uses self.storage to read in habits into self.habits.
         """
-        self.habits = self.storage.read()
+        if self.lazy:
+            self.habits = self.storage.read_headers()
+            self.partial = {h.name for h in self.habits}
+        else:
+            self.habits = self.storage.read()
+            self.partial = set()
         if not self.check_names_unique():
             # Ensure habit names are unique
             sys.exit("A habit name is not unique. Pls fix.")
@@ -92,6 +306,12 @@ class HabitTracker:
         """
         self.storage.save(self.habits)
 
+    def close(self):
+        """
+        Closes self.storage, the tracker is not used afterwards.
+        """
+        self.storage.close()
+
     def read_from(self, file: str, store_kind: StorageKind):
         """
         !! Not Implemented Yet !!
@@ -118,100 +338,221 @@ class HabitTracker:
         """
         return [repr(h) for h in self.habits if not h.completed]
 
+    @timed("HabitTracker.complete")
     def complete(self, n: str):
         """
-        Marks a habit as completed.
+        Marks the habit called n as completed.
         """
         # log("Habit to be marked complete:" + n)
-        for h in self.habits:
-            if n == repr(h):
-                h.complete()
-                # log("After marked:\n" + str(h))
-                break
+        h = self.by_name.get(n)
+        if h is None:
+            return
+        self.load_history(h)
+        h.complete()
+        # log("After marked:\n" + str(h))
+        self.rank(h)
+        self.schedule(h)
+        self.version += 1
+        lcd = h.last_completed_date()
+        assert lcd is not None
+        self.storage.record_complete(h, lcd)
+
+    @timed("HabitTracker.complete_many")
+    def complete_many(self, records: Iterable[tuple[str, datetime]]) -> int:
+        """
+        Completes habits at the given times, e.g. when importing a history.
+        records are (habit name, time) pairs in any order,
+        names of habits that are not tracked are skipped.
+
+        The times are grouped by habit and added with Habit.add_completions,
+        so every habit is updated, ranked and recorded once.
+        Returns the number of completions added.
+        """
+        times: dict[str, list[datetime]] = {}
+        for name, t in records:
+            times.setdefault(name, []).append(t)
+        total = 0
+        for name, ts in times.items():
+            h = self.by_name.get(name)
+            if h is None:
+                continue
+            self.load_history(h)
+            added = h.add_completions(ts)
+            if not added:
+                continue
+            self.rank(h)
+            self.schedule(h)
+            self.storage.record_completions(h, added)
+            total += len(added)
+        if total:
+            self.version += 1
+        return total
 
     def addHabit(self, name: str, symbol: str, period_length: PeriodLength):
         """
         Adds a new habit with given name, symbol and period_length to be tracked.
         """
-        self.habits.append(Habit.new(name, symbol, period_length))
+        h = Habit.new(name, symbol, period_length)
+        self.habits.append(h)
+        self.by_name[h.name] = h
+        self.rank(h)
+        self.version += 1
+        self.storage.record_add(h)
 
     def deleteHabit(self, n: str):
         """
-        Deletes the habit where repr(Habit) == n.
+        Deletes the habit called n.
         """
-        for h in self.habits:
-            if n == repr(h):
-                self.habits.remove(h)
+        h = self.by_name.get(n)
+        if h is None:
+            return
+        self.habits.remove(h)
+        del self.by_name[h.name]
+        for (_, p), board in self.leaderboards.items():
+            if p is None or p == h.period_length:
+                board.remove(h.name)
+        self.unschedule(h.name)
+        self.version += 1
+        self.storage.record_delete(h)
     
     def getHabit(self, n: str) -> Optional[Habit]:
         """
-        Returns a habit where repr(Habit) == n, if it exists.
+        Returns the habit called n, if it exists.
         Otherwise returns None.
         """
-        for h in self.habits:
-            if n == repr(h):
-                return h
-        return None
+        h = self.by_name.get(n)
+        if h is not None:
+            self.load_history(h)
+        return h
+
+    def load_history(self, h: Habit):
+        """
+        Reads in the full completion history of h, if it has not been read yet.
+        """
+        if h.name in self.partial:
+            history = self.storage.read_history(h)
+            # Storage may have read it completely after all
+            if history is not h.completed_times:
+                h.completed_times = history
+            self.partial.discard(h.name)
+
+    def analytics(self) -> Analytics:
+        """
+        Returns the Analytics of the tracked habits.
+        Only recomputed if the habits changed since the last call.
+        """
+        if self._analytics is None or self._analytics_version != self.version:
+            self._analytics = Analytics(self.habits)
+            self._analytics_version = self.version
+        return self._analytics
+
+    def history(self, weeks: int = 12) -> History:
+        """
+        Returns the History of the tracked habits over the last weeks weeks.
+        Needs every completion history, so they are all loaded first.
+        Only recomputed if the habits changed or the day changed since the last call.
+        """
+        key = (self.version, weeks, period_index(to_epoch(datetime.now()), PeriodLength.daily))
+        if self._history is None or self._history_key != key:
+            for h in self.habits:
+                self.load_history(h)
+            self._history = History(self.habits, weeks)
+            self._history_key = key
+        return self._history
+
+    def heatmap(self, h: Habit, weeks: int = 12) -> list[list[int]]:
+        """
+        Returns the number of completions of h per week (oldest first)
+        and day of the week (Monday first), over the last weeks weeks.
+        """
+        self.load_history(h)
+        return History([h], weeks).heatmap(0)
+
+    def rank(self, h: Habit):
+        """
+        Updates the leaderboards after the streaks of h changed. O(log n).
+        """
+        for (ever, p), board in self.leaderboards.items():
+            if p is None or p == h.period_length:
+                board.set(h.name, lstreak(h) if ever else streak(h))
+
+    def topStreaks(self, n: int, period: Optional[PeriodLength] = None) -> list[Habit]:
+        """
+        Returns the n habits (of the given period) with the longest, ongoing streaks.
+        """
+        return [self.by_name[name] for name, _ in self.leaderboards[(False, period)].top(n)]
+
+    def topLongestStreaks(self, n: int, period: Optional[PeriodLength] = None) -> list[Habit]:
+        """
+        Returns the n habits (of the given period) with the longest streaks recorded.
+        """
+        return [self.by_name[name] for name, _ in self.leaderboards[(True, period)].top(n)]
 
     def nrDailyHabits(self) -> int:
         """
         Returns the number of daily habits tracked.
         """
-        return len([h for h in self.habits if h.period_length == PeriodLength.daily])
+        return self.analytics().daily
 
     def nrWeeklyHabits(self) -> int:
         """
         Returns the number of weekly habits tracked.
         """
-        return len([h for h in self.habits if h.period_length == PeriodLength.weekly])
+        return self.analytics().weekly
+
+    @staticmethod
+    def fmtCurrent(l: Optional[Habit]) -> str:
+        """
+        Helper method for formatting the name and streak length of l.
+        """
+        if l is None:
+            return "None"
+        return f"{l.name}: {l.streak_length}"
+
+    @staticmethod
+    def fmtLongest(l: Optional[Habit]) -> str:
+        """
+        Helper method for formatting the name and longest streak of l.
+        """
+        if l is None or l.longest_streak is None or l.longest_streak == 0:
+            return "None"
+        return f"{l.name}: {l.longest_streak}"
 
     def currentLongestStreak(self) -> str:
         """
         Returns the name and the streak length of the habit with the longest, ongoing streak.
         """
-        l = max(iter(self.habits), key=streak)
-        return f"{l.name}: {l.streak_length}"
+        return self.fmtCurrent(self.analytics().current_longest[None])
 
     def currentLongestDailyStreak(self) -> str:
         """
         Returns the name and the streak length of the daily habit with the longest, ongoing streak.
         """
-        l = max(iter(self.get_daily()), key=streak)
-        return f"{l.name}: {l.streak_length}"
+        return self.fmtCurrent(self.analytics().current_longest[PeriodLength.daily])
 
     def currentLongestWeeklyStreak(self) -> str:
         """
         Returns the name and the streak length of the weekly habit with the longest, ongoing streak.
         """
-        l = max(iter(self.get_weekly()), key=streak)
-        return f"{l.name}: {l.streak_length}"
+        return self.fmtCurrent(self.analytics().current_longest[PeriodLength.weekly])
 
     def longestEverStreak(self) -> str:
         """
         Returns the name and the streak length of the habit with the longest streak recorded.
         """
-        l = max(iter(self.habits), key=lstreak)
-        if l.longest_streak is None or l.longest_streak == 0:
-            return "None"
-        return f"{l.name}: {l.longest_streak}"
+        return self.fmtLongest(self.analytics().longest_ever[None])
 
     def longestEverDailyStreak(self) -> str:
         """
         Returns the name and the streak length of the daily habit with the longest streak recorded.
         """
-        l = max(iter(self.get_daily()), key=lstreak)
-        if l.longest_streak is None or l.longest_streak == 0:
-            return "None"
-        return f"{l.name}: {l.longest_streak}"
+        return self.fmtLongest(self.analytics().longest_ever[PeriodLength.daily])
 
     def longestEverWeeklyStreak(self) -> str:
         """
         Returns the name and the streak length of the weekly habit with the longest streak recorded.
         """
-        l = max(iter(self.get_weekly()), key=lstreak)
-        if l.longest_streak is None or l.longest_streak == 0:
-            return "None"
-        return f"{l.name}: {l.longest_streak}"
+        return self.fmtLongest(self.analytics().longest_ever[PeriodLength.weekly])
 
     def get_weekly(self) -> list[Habit]:
         """
@@ -229,43 +570,36 @@ class HabitTracker:
         """
         Returns true if the names of all tracked habits are unique.
         """
-        names = [h.name for h in self.habits]
-        for n in names:
-            if names.count(n) != 1:
-                return False
-        return True
+        return len(self.by_name) == len(self.habits)
             
     def check_name_unique(self, n: str) -> bool:
         """
         Checks if the name n is unique agains all other tracked habits.
         """
-        return len([1 for h in self.habits if h.name == n]) == 0
+        return n not in self.by_name
             
+    @timed("HabitTracker.update")
     def update(self):
         """
         Updates all habits according to their period length
-        if a new day or new week has started
-        """
-        # for h in self.habits:
-        #     for ct in h.completed_times:
-        #         log(repr(ct))
-        for h in self.habits:
-            lcd = h.last_completed_date()
-            if lcd is None:
-                continue
-            now = datetime.now().replace(microsecond=0)
-            assert not (h.streak_length > 0 and lcd is None)
-            if h.streak_length > 0 and\
-               ((h.period_length == PeriodLength.daily and lcd.day < now.day)\
-               or (h.period_length == PeriodLength.weekly and\
-               lcd.isocalendar().week < now.isocalendar().week)):
-                # New week/day
-                # If streak == 0, not completed and thus do nothing
-                if h.completed:
-                    # Was completed and thus streak already increased by 1
-                    # and completed_times was already added,
-                    # so only set to False
-                    h.completed = False
-                else:
-                    # Was not completed, so reset streak
-                    h.streak_length = 0
+        if a new day or new week has started.
+
+        Nothing happens before next_rollover. After it, only the habits
+        in the buckets of periods that ended are looked at.
+        """
+        now = to_epoch(datetime.now())
+        if now < self.next_rollover:
+            return
+        current = current_periods(now)
+        # Weeks also start at midnight
+        self.next_rollover = (current[PeriodLength.daily] + 1) * DAY
+        for p, buckets in self.buckets.items():
+            cur = current[p]
+            for last in [l for l in buckets if l < cur]:
+                for name in list(buckets[last]):
+                    h = self.by_name[name]
+                    if rollover(h, current):
+                        self.version += 1
+                        self.rank(h)
+                    # Still there if the streak goes on, as it ends if the current period is missed
+                    self.schedule(h)
@@ -0,0 +1,235 @@
+"""Provides a wrapper running the writes of a storage implementation on a background thread."""
+from typing import Any, Callable, Optional
+from contextlib import contextmanager
+from collections.abc import Iterator, Sequence
+from datetime import datetime
+from threading import Condition, Thread
+from collections import deque
+
+from habit import Habit
+from storage import StorageInterface
+
+class BackgroundStorage:
+    """
+    Wraps a StorageInterface, running save and the record methods on a worker thread,
+    so a slow write never blocks the caller.
+    Implements StorageInterface.
+
+    Writes are run in the order they were requested.
+    The record methods get a copy of the habit without its history,
+    none of the storage implementations need it to record a change.
+    save takes a snapshot of the habits right away, and if several saves are queued
+    only the newest one is written, as it contains the changes of the others.
+    Reads wait for all queued writes first, except read_history, which only waits
+    for the writes recording a change of that habit, so loading a history is never held up
+    by a slow save. The wrapped storage has to allow reading a history while it writes.
+    The writes requested inside batch are queued as one write, run in a batch of storage.
+
+    An exception raised by a write is kept until it is taken with take_error,
+    it is never raised from another call, as that could be anywhere in the caller.
+
+    Attributes
+    ----------
+    storage: StorageInterface
+        The wrapped storage, only used by the worker while writes are queued.
+    queue: deque[tuple[Callable, tuple]]
+        The queued writes.
+    saves: int
+        Number of saves in queue.
+    busy: bool
+        If the worker is running a write.
+    running: Optional[tuple[Callable, tuple]]
+        The write the worker is running.
+    closed: bool
+        If close was called, no more writes are accepted.
+    error: Optional[BaseException]
+        The exception of a failed write, if any.
+    batched: Optional[list[tuple[Callable, tuple]]]
+        The writes requested inside batch, queued when it ends.
+
+    Methods
+    -------
+    flush()
+    close()
+    take_error() -> Optional[BaseException]
+    idle() -> bool
+    batch()
+    """
+    storage: StorageInterface
+    queue: deque[tuple[Callable[..., Any], tuple]]
+    saves: int = 0
+    busy: bool = False
+    running: Optional[tuple[Callable[..., Any], tuple]] = None
+    closed: bool = False
+    error: Optional[BaseException] = None
+    batched: Optional[list[tuple[Callable[..., Any], tuple]]] = None
+    cond: Condition
+    thread: Thread
+
+    def __init__(self, storage: StorageInterface):
+        """
+        Constructor for BackgroundStorage.
+        Starts the worker thread.
+        """
+        self.storage = storage
+        self.queue = deque()
+        self.cond = Condition()
+        self.thread = Thread(target=self.work, name="BackgroundStorage", daemon=True)
+        self.thread.start()
+
+    def work(self):
+        """
+        The worker thread, runs queued writes until closed.
+        """
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+                fn, args = self.queue.popleft()
+                if fn == self.storage.save:
+                    self.saves -= 1
+                    if self.saves > 0:
+                        # A newer snapshot is queued
+                        continue
+                self.busy = True
+                self.running = (fn, args)
+            try:
+                fn(*args)
+            except BaseException as e:
+                with self.cond:
+                    self.error = e
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.running = None
+                    self.cond.notify_all()
+
+    def submit(self, fn: Callable[..., Any], *args):
+        """
+        Helper method for queueing a write.
+        """
+        if self.batched is not None:
+            self.batched.append((fn, args))
+            return
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("BackgroundStorage is closed")
+            if fn == self.storage.save:
+                self.saves += 1
+            self.queue.append((fn, args))
+            self.cond.notify_all()
+
+    def flush(self):
+        """
+        Waits until all queued writes are done.
+        """
+        with self.cond:
+            while self.queue or self.busy:
+                self.cond.wait()
+
+    def close(self):
+        """
+        Runs the queued writes, stops the worker and closes storage.
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+        self.storage.close()
+
+    def take_error(self) -> Optional[BaseException]:
+        """
+        Returns the exception of the last failed write, if any, and forgets it.
+        """
+        with self.cond:
+            e, self.error = self.error, None
+            return e
+
+    def idle(self) -> bool:
+        """
+        Returns if all queued writes are done.
+        """
+        with self.cond:
+            return not self.queue and not self.busy
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Queues the writes requested in the with block as a single write."""
+        self.batched = []
+        try:
+            yield
+            writes = self.batched
+        finally:
+            self.batched = None
+        if writes:
+            self.submit(self.run_batch, writes)
+
+    def run_batch(self, writes: list[tuple[Callable[..., Any], tuple]]):
+        """
+        Helper method for running writes in a batch of storage, on the worker.
+        """
+        with self.storage.batch():
+            for fn, args in writes:
+                fn(*args)
+
+    def read(self) -> list[Habit]:
+        """Reads in the habits, after all queued writes."""
+        self.flush()
+        return self.storage.read()
+
+    def iter_habits(self) -> Iterator[Habit]:
+        """Reads in the habits one at a time, after all queued writes."""
+        self.flush()
+        return self.storage.iter_habits()
+
+    def read_headers(self) -> list[Habit]:
+        """Reads in the habit headers, after all queued writes."""
+        self.flush()
+        return self.storage.read_headers()
+
+    def read_history(self, habit: Habit) -> Sequence[datetime]:
+        """
+        Reads in all completions of habit, after the queued writes recording a change of habit.
+        Other writes, saves in particular, are not waited for.
+        """
+        with self.cond:
+            writes = list(self.queue)
+            if self.running is not None:
+                writes.append(self.running)
+        if any(self.records(w, habit.name) for w in writes):
+            self.flush()
+        return self.storage.read_history(habit)
+
+    def records(self, write: tuple[Callable[..., Any], tuple], name: str) -> bool:
+        """
+        Helper method returning if write records a change of the habit called name.
+        A save only writes changes that were recorded before it, so it never does.
+        """
+        fn, args = write
+        if fn == self.run_batch:
+            return any(self.records(w, name) for w in args[0])
+        if fn == self.storage.save:
+            return False
+        return args[0].name == name
+
+    def save(self, habits: list[Habit]):
+        """Queues saving a snapshot of habits."""
+        self.submit(self.storage.save, [h.copy() for h in habits])
+
+    def record_complete(self, habit: Habit, time: datetime):
+        """Queues recording a completion of habit."""
+        self.submit(self.storage.record_complete, habit.copy(history=False), time)
+
+    def record_completions(self, habit: Habit, times: list[datetime]):
+        """Queues recording many completions of habit."""
+        self.submit(self.storage.record_completions, habit.copy(history=False), list(times))
+
+    def record_add(self, habit: Habit):
+        """Queues recording a newly added habit."""
+        self.submit(self.storage.record_add, habit.copy(history=False))
+
+    def record_delete(self, habit: Habit):
+        """Queues recording a deleted habit."""
+        self.submit(self.storage.record_delete, habit.copy(history=False))
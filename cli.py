@@ -0,0 +1,205 @@
+"""Provides the command line interface of the habit tracker, for use without the Tui."""
+from typing import Optional
+import argparse
+import json
+import shlex
+import sys
+
+from app import HabitTracker, lstreak
+from habit import Habit, PeriodLength
+from storage import StorageKind
+
+# NOTE: Nothing in here may import tui (and thus blessed), to keep scripts fast.
+
+def parser() -> argparse.ArgumentParser:
+    """
+    Returns the parser for the command line arguments.
+    Without a command, the Tui is started.
+    """
+    p = argparse.ArgumentParser(prog="main.py", description="A habit tracking app.")
+    p.add_argument("-f", "--file", default="habits.org",
+                   help="the habits file, .org, .bin or .db/.sqlite/.sqlite3 (default: habits.org)")
+    p.add_argument("--backup", action="store_true",
+                   help="keep the previous org file as bk.<file> when it is rewritten")
+    p.add_argument("--profile-startup", action="store_true",
+                   help="only draw the first frame of the Tui and print how long it took")
+    sub = p.add_subparsers(dest="command")
+
+    c = sub.add_parser("complete", help="complete habits")
+    c.add_argument("names", nargs="+", metavar="name")
+
+    l = sub.add_parser("list", help="list habits")
+    l.add_argument("--period", choices=["daily", "weekly"])
+    l.add_argument("--todo", action="store_true", help="only list uncompleted habits")
+
+    s = sub.add_parser("stats", help="show analytics")
+    s.add_argument("--json", action="store_true", help="print as json")
+    s.add_argument("--top", type=int, default=3, help="length of the streak leaderboards")
+
+    a = sub.add_parser("add", help="add a habit")
+    a.add_argument("name")
+    a.add_argument("--symbol", required=True)
+    a.add_argument("--period", choices=["daily", "weekly"], required=True)
+
+    d = sub.add_parser("delete", help="delete habits")
+    d.add_argument("names", nargs="+", metavar="name")
+
+    sub.add_parser("batch", help="run one command per line of stdin, saving once at the end")
+    return p
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments argv (default: sys.argv).
+    Exits with a usage error if the Tui would be started on a file that is not an org file.
+    """
+    p = parser()
+    args = p.parse_args(argv)
+    if args.command is None and not args.file.endswith(".org"):
+        p.error(f"the Tui only supports .org files, got: {args.file}")
+    return args
+
+def open_tracker(file: str, backup: bool = False) -> HabitTracker:
+    """
+    Returns a HabitTracker for file, choosing the StorageKind by its extension.
+    Org and SQLite files are read lazily, no command needs the histories except of the habits it completes.
+    """
+    if file.endswith(".org"):
+        return HabitTracker(StorageKind.org, file, journal=True, lazy=True, backup=backup, cache=True)
+    if file.endswith(".bin"):
+        return HabitTracker(StorageKind.binary, file)
+    return HabitTracker(StorageKind.sqlite, file, lazy=True)
+
+def period(p: Optional[str]) -> Optional[PeriodLength]:
+    """Helper method for converting a period argument."""
+    if p is None:
+        return None
+    return PeriodLength.daily if p == "daily" else PeriodLength.weekly
+
+def streak_json(h: Optional[Habit]) -> Optional[dict]:
+    """Helper method for the json of a habit's streaks."""
+    if h is None:
+        return None
+    ls = h.longest_streak
+    return {
+        "name": h.name,
+        "streak": h.streak_length,
+        "longest_streak": None if ls is None else
+            {"length": ls.length, "begin": str(ls.begin), "end": str(ls.end)},
+    }
+
+def stats(tracker: HabitTracker, as_json: bool, top: int):
+    """Prints the analytics of tracker."""
+    a = tracker.analytics()
+    if as_json:
+        keys = {"all": None, "daily": PeriodLength.daily, "weekly": PeriodLength.weekly}
+        print(json.dumps({
+            "total": a.total,
+            "completed": a.completed,
+            "daily": a.daily,
+            "weekly": a.weekly,
+            "current_longest": {k: streak_json(a.current_longest[p]) for k, p in keys.items()},
+            "longest_ever": {k: streak_json(a.longest_ever[p]) for k, p in keys.items()},
+            "top_streaks": {k: [streak_json(h) for h in tracker.topStreaks(top, p)]
+                            for k, p in keys.items()},
+            "top_longest_streaks": {k: [streak_json(h) for h in tracker.topLongestStreaks(top, p)]
+                                    for k, p in keys.items()},
+        }, indent=2))
+        return
+    print(f"Total number of habits: {a.total}")
+    print(f"Completed habits: {a.completed}")
+    print(f"Daily habits: {a.daily}")
+    print(f"Weekly habits: {a.weekly}")
+    print(f"Current longest streak: {tracker.currentLongestStreak()}")
+    print(f"Longest ever streak: {tracker.longestEverStreak()}")
+    print("Top current streaks: " + ", ".join(f"{h.name}: {h.streak_length}" for h in tracker.topStreaks(top)))
+    print("Top streaks ever: " + ", ".join(f"{h.name}: {lstreak(h)}" for h in tracker.topLongestStreaks(top)))
+
+def check(names: set[str], args: argparse.Namespace) -> bool:
+    """
+    Checks that the command in args can be applied, given the habit names,
+    which are updated as the command would.
+    Returns False (after printing why to stderr) if it can not.
+    """
+    match args.command:
+        case "complete" | "delete":
+            for n in args.names:
+                if n not in names:
+                    print(f"Unknown habit: {n}", file=sys.stderr)
+                    return False
+                if args.command == "delete":
+                    names.remove(n)
+        case "add":
+            if args.name in names:
+                print(f"Habit already exists: {args.name}", file=sys.stderr)
+                return False
+            names.add(args.name)
+    return True
+
+def apply(tracker: HabitTracker, args: argparse.Namespace):
+    """
+    Applies a single, already checked, command to tracker without saving.
+    """
+    match args.command:
+        case "complete":
+            for n in args.names:
+                h = tracker.by_name[n]
+                if h.completed:
+                    print(f"Already completed: {n}", file=sys.stderr)
+                    continue
+                tracker.complete(n)
+        case "delete":
+            for n in args.names:
+                tracker.deleteHabit(n)
+        case "add":
+            p = period(args.period)
+            assert p is not None
+            tracker.addHabit(args.name, args.symbol, p)
+        case "list":
+            p = period(args.period)
+            for h in tracker.habits:
+                if (p is None or h.period_length == p) and not (args.todo and h.completed):
+                    print(f"{'DONE' if h.completed else 'TODO'} {h!r}")
+        case "stats":
+            stats(tracker, args.json, args.top)
+
+def run(args: argparse.Namespace) -> int:
+    """
+    Runs the command in args, reading the habits once and saving once at the end.
+    The batch command reads one command per line from stdin.
+    All commands are checked before any is applied, so either all or none are.
+    Their changes are recorded in a single batch of the storage (see StorageInterface.batch).
+    Returns the exit code.
+    """
+    tracker = open_tracker(args.file, args.backup)
+    try:
+        return run_commands(tracker, args)
+    finally:
+        tracker.close()
+
+def run_commands(tracker: HabitTracker, args: argparse.Namespace) -> int:
+    """
+    Helper method for run, running the command in args on tracker.
+    """
+    if args.command == "batch":
+        p = parser()
+        commands = []
+        for line in sys.stdin:
+            if line.strip() == "" or line.lstrip().startswith("#"):
+                continue
+            cmd = p.parse_args(["--file", args.file] + shlex.split(line))
+            if cmd.command in (None, "batch"):
+                print(f"Not allowed in batch: {line.strip()}", file=sys.stderr)
+                return 2
+            commands.append(cmd)
+    else:
+        commands = [args]
+
+    names = set(tracker.by_name)
+    if not all(check(names, c) for c in commands):
+        print("Nothing changed.", file=sys.stderr)
+        return 1
+    with tracker.storage.batch():
+        for c in commands:
+            apply(tracker, c)
+    tracker.save()
+    return 0
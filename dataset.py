@@ -0,0 +1,114 @@
+"""
+Generates large, realistic habit datasets, for benchmarks (see test_bench.py).
+
+Usage:
+    python dataset.py FILE [--size SIZE | --habits N --completions N] [--seed SEED]
+"""
+from typing import Optional
+from array import array
+from datetime import datetime
+import argparse
+import random
+import string
+import sys
+
+from habit import Habit, PeriodLength, StreakPeriod, Completions, to_epoch, from_epoch, period_index
+from storage import OrgStorage
+
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+
+# (habits, completions) by name
+SIZES = {
+    "small": (10, 1_000),
+    "medium": (1_000, 100_000),
+    "large": (100_000, 10_000_000),
+}
+
+# Chance of missing a period, which ends a streak
+MISS = 0.1
+
+def period_start(p: int, period_length: PeriodLength) -> int:
+    """
+    Returns the epoch the period with period_index p starts at. Inverse of period_index.
+    """
+    if period_length == PeriodLength.daily:
+        return p * DAY
+    return (7 * p - 3) * DAY
+
+def habit(i: int, completions: int, rng: random.Random, now: int) -> Habit:
+    """
+    Returns the habit number i, completed completions times.
+
+    Completed (at most) once per period, up to the current one,
+    missing a period every now and then. The streaks are set like
+    they would be by completing the habit at those times.
+    """
+    period_length = PeriodLength.daily if rng.random() < 0.7 else PeriodLength.weekly
+    length = DAY if period_length == PeriodLength.daily else WEEK
+    cur = period_index(now, period_length)
+
+    # Periods completed in, walking back from the current one
+    periods: list[int] = []
+    p = cur
+    while len(periods) < completions:
+        if rng.random() >= MISS:
+            periods.append(p)
+        p -= 1
+    periods.reverse()
+
+    epochs = array('q')
+    run = run_start = 0
+    longest: Optional[StreakPeriod] = None
+    last: Optional[int] = None
+    for p in periods:
+        e = min(period_start(p, period_length) + rng.randrange(length), now)
+        epochs.append(e)
+        if last is None or p > last + 1:
+            run = 0
+            run_start = e
+        run += 1
+        last = p
+        if longest is None or run >= longest.length:
+            longest = StreakPeriod(run, from_epoch(run_start), from_epoch(e))
+
+    created = periods[0] if periods else cur - rng.randrange(100)
+    completed = last == cur
+    streak = run if last is not None and last >= cur - 1 else 0
+    h = Habit(f"Habit {i}", rng.choice(string.ascii_letters), period_length,
+              from_epoch(period_start(created, period_length)), streak, completed, [], longest)
+    h.completed_times = Completions.from_epochs(epochs, sort=False)
+    return h
+
+def habits(n: int, completions: int, seed: int = 0, now: Optional[datetime] = None) -> list[Habit]:
+    """
+    Returns n habits with completions completions in total, spread evenly.
+    The same seed and now always give the same habits.
+    """
+    if now is None:
+        now = datetime.now()
+    rng = random.Random(seed)
+    e = to_epoch(now)
+    each, rest = divmod(completions, n) if n > 0 else (0, 0)
+    return [habit(i, each + (i < rest), rng, e) for i in range(n)]
+
+def main(argv: Optional[list[str]] = None):
+    """
+    Writes a generated dataset to an org file.
+    """
+    p = argparse.ArgumentParser(prog="dataset.py", description="Generate a habit dataset as an org file.")
+    p.add_argument("file", help="the org file to write")
+    p.add_argument("--size", choices=SIZES, default="small", help="a predefined size (default: small)")
+    p.add_argument("--habits", type=int, help="number of habits, overrides --size")
+    p.add_argument("--completions", type=int, help="total number of completions, overrides --size")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args(argv)
+    n, c = SIZES[args.size]
+    if args.habits is not None:
+        n = args.habits
+    if args.completions is not None:
+        c = args.completions
+    OrgStorage(args.file).save(habits(n, c, args.seed))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,13 @@
 # NOTE: Used for returning Habit inside definition
 from __future__ import annotations
 
+from array import array
+from bisect import bisect_left, insort
+from collections.abc import Iterable, Iterator, Sequence
+from itertools import islice
+from operator import gt
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, overload
 from enum import StrEnum
 
 from log import log
@@ -19,6 +24,165 @@ class PeriodLength(StrEnum):
     daily = "Daily"
     weekly = "Weekly"
 
+EPOCH = datetime(1970, 1, 1)
+SECOND = timedelta(seconds=1)
+
+def to_epoch(dt: datetime) -> int:
+    """
+    Returns the seconds since 1970-01-01 of the (naive) datetime dt.
+    Microseconds are dropped.
+    """
+    return (dt - EPOCH) // SECOND
+
+def from_epoch(seconds: int) -> datetime:
+    """
+    Returns the (naive) datetime seconds after 1970-01-01.
+    Inverse of to_epoch.
+    """
+    return EPOCH + timedelta(seconds=seconds)
+
+def period_index(epoch: int, period_length: PeriodLength) -> int:
+    """
+    Returns the index of the period (day or ISO week) containing epoch (see to_epoch).
+    Consecutive periods have consecutive indices, also across months and years.
+    """
+    day = epoch // 86400
+    if period_length == PeriodLength.daily:
+        return day
+    # 1970-01-01 was a thursday, weeks start on monday
+    return (day + 3) // 7
+
+class Completions(Sequence):
+    """
+    A sorted sequence of completion times.
+
+    Stores the times as seconds since 1970-01-01 in an array('q'),
+    which takes 8 bytes per completion instead of ~56 for a list of datetimes.
+    Behaves like a list[datetime] for reading, i.e. indexing and iterating yield datetimes.
+
+    Attributes
+    ----------
+    epochs: array
+        The sorted completion times in seconds since 1970-01-01. See to_epoch.
+
+    Methods
+    -------
+    append(dt: datetime)
+    extend(dts: Iterable[datetime])
+    merge(dts: Iterable[datetime]) -> list[datetime]
+    sort()
+    copy() -> Completions
+    """
+    __slots__ = ("epochs",)
+    epochs: array
+
+    def __init__(self, times: Iterable[datetime] = ()):
+        """
+        Constructor for Completions.
+        Only sorts if times is not already sorted.
+        """
+        self.epochs = array('q', map(to_epoch, times))
+        if len(self.epochs) > 1:
+            self.sort()
+
+    @staticmethod
+    def from_epochs(epochs: array, sort: bool = True) -> Completions:
+        """
+        Creates Completions directly from an array('q') of epoch seconds, without copying.
+        sort can be unset if epochs is known to be sorted.
+        """
+        c = Completions.__new__(Completions)
+        c.epochs = epochs
+        if sort:
+            c.sort()
+        return c
+
+    def __len__(self) -> int:
+        return len(self.epochs)
+
+    @overload
+    def __getitem__(self, idx: int) -> datetime: ...
+    @overload
+    def __getitem__(self, idx: slice) -> list[datetime]: ...
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [from_epoch(e) for e in self.epochs[idx]]
+        return from_epoch(self.epochs[idx])
+
+    def __setitem__(self, idx: int, dt: datetime):
+        self.epochs[idx] = to_epoch(dt)
+        self.sort()
+
+    def __iter__(self) -> Iterator[datetime]:
+        return map(from_epoch, self.epochs)
+
+    def __reversed__(self) -> Iterator[datetime]:
+        return map(from_epoch, reversed(self.epochs))
+
+    def __contains__(self, dt: object) -> bool:
+        return isinstance(dt, datetime) and to_epoch(dt) in self.epochs
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Completions):
+            return self.epochs == other.epochs
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def append(self, dt: datetime):
+        """Adds dt, keeping the times sorted."""
+        e = to_epoch(dt)
+        if len(self.epochs) == 0 or self.epochs[-1] <= e:
+            self.epochs.append(e)
+        else:
+            insort(self.epochs, e)
+
+    def extend(self, dts: Iterable[datetime]):
+        """Adds all of dts, keeping the times sorted."""
+        self.epochs.extend(to_epoch(dt) for dt in dts)
+        self.sort()
+
+    def merge(self, dts: Iterable[datetime]) -> list[datetime]:
+        """
+        Adds the times of dts that are not in self yet, in a single pass over self.
+        Returns the added times, sorted.
+        """
+        new = sorted(set(map(to_epoch, dts)))
+        e = self.epochs
+        if not new:
+            return []
+        if len(e) == 0 or e[-1] < new[0]:
+            # Only newer times, e.g. an import of recent completions
+            e.extend(new)
+            return [from_epoch(x) for x in new]
+        merged = array('q')
+        added: list[int] = []
+        i = 0
+        for x in new:
+            j = bisect_left(e, x, i)
+            merged.extend(e[i:j])
+            i = j
+            if i < len(e) and e[i] == x:
+                continue
+            merged.append(x)
+            added.append(x)
+        merged.extend(e[i:])
+        self.epochs = merged
+        return [from_epoch(x) for x in added]
+
+    def copy(self) -> Completions:
+        """Returns a copy that does not share the underlying array."""
+        return Completions.from_epochs(array('q', self.epochs), sort=False)
+
+    def sort(self):
+        """Sorts the times, if they are not sorted already."""
+        e = self.epochs
+        if any(map(gt, e, islice(e, 1, None))):
+            self.epochs = array('q', sorted(e))
+
 class StreakPeriod:
     """
     A class used to represent longest streak of habit
@@ -34,6 +198,7 @@ class StreakPeriod:
 
     Because fuck tuples. Can't index them for some reason.
     """
+    __slots__ = ("length", "begin", "end")
     length: int
     begin: datetime
     end: datetime
@@ -71,27 +236,48 @@ class Habit():
     completed: bool
         A boolean to quickly check if a habit has been completed for the current period already.
         This could be removed but since python is slow used for quick checking.
-    completed_times: list[datetime]
-        A list of datetimes storing every time a habit was completed.
+    completed_times: Completions
+        A sorted sequence of datetimes storing every time a habit was completed.
+        Assigning any iterable of datetimes converts it to Completions.
+
+    The current run of consecutive periods with a completion is tracked in
+    _run_start (epoch of its first completion), _run_length (number of periods)
+    and _last_period (period_index of the last completion).
+    It is rebuilt from completed_times when _seen (the number of completions
+    it reflects) does not match anymore, and updated in O(1) by complete.
 
     Methods
     -------
     new(name: str, symbol: str, period_length: PeriodLength) -> Habit
     last_completed_date() -> Optional[datetime]
+    last_period() -> Optional[int]
+    rebuild_streak() -> Optional[StreakPeriod]
+    complete(now: Optional[datetime] = None)
+    add_completions(times: Iterable[datetime], now: Optional[datetime] = None) -> list[datetime]
+    copy(history: bool = True) -> Habit
     """
+    # NOTE: Slots instead of a __dict__ per habit, as there can be a lot of them.
+    # Which also means no class level defaults, every attribute is set in __init__.
+    __slots__ = ("name", "symbol", "creation_date", "streak_length", "longest_streak",
+                 "period_length", "completed", "_completed_times",
+                 "_run_start", "_run_length", "_last_period", "_seen")
     name: str
     symbol: str
     creation_date: datetime
-    streak_length: int = 0
-    longest_streak: Optional[StreakPeriod] = None
+    streak_length: int
+    longest_streak: Optional[StreakPeriod]
     period_length: PeriodLength
-    completed: bool = False
-    completed_times: list[datetime] = list()
+    completed: bool
+    _completed_times: Completions
+    _run_start: int
+    _run_length: int
+    _last_period: Optional[int]
+    _seen: int
 
 
     def __init__(self, name: str, symbol: str, period_length: PeriodLength,
                  creation_date: datetime, streak_length: int,
-                 completed: bool, completed_times: list[datetime],
+                 completed: bool, completed_times: Iterable[datetime],
                  longest_streak: Optional[StreakPeriod] = None):
         """
         Constructer for a Habit.
@@ -104,7 +290,18 @@ class Habit():
         self.longest_streak = longest_streak
         self.completed = completed
         self.completed_times = completed_times
-        self.completed_times.sort()
+
+    @property
+    def completed_times(self) -> Completions:
+        return self._completed_times
+
+    @completed_times.setter
+    def completed_times(self, times: Iterable[datetime]):
+        if not isinstance(times, Completions):
+            times = Completions(times)
+        self._completed_times = times
+        # Streak state has to be rebuilt
+        self._seen = -1
 
     @staticmethod
     def new(name: str, symbol: str, period_length: PeriodLength) -> Habit:
@@ -129,6 +326,17 @@ Creation Date: {self.creation_date}"""
     def __repr__(self):
         return f"{self.symbol} {self.name}: {self.period_length}, Streak: {self.streak_length}"
 
+    def copy(self, history: bool = True) -> Habit:
+        """
+        Returns a copy of the habit that can be changed (e.g. completed)
+        without affecting the original.
+        If history is False, the copy has no completed_times.
+        """
+        return Habit(self.name, self.symbol, self.period_length, self.creation_date,
+                     self.streak_length, self.completed,
+                     self.completed_times.copy() if history else Completions(),
+                     self.longest_streak)
+
     def last_completed_date(self) -> Optional[datetime]:
         """
         A helper function that returns the last time a Habit was completed.
@@ -139,31 +347,98 @@ Creation Date: {self.creation_date}"""
             return None
         return self.completed_times[-1]
 
-    def complete(self):
-        """Sets self.longest_streak if necessary after completing habit."""
-        now = datetime.now().replace(microsecond=0)
+    def last_period(self) -> Optional[int]:
+        """
+        Returns the period_index of the last completion, or None if never completed.
+        """
+        if self._seen == len(self.completed_times):
+            return self._last_period
+        epochs = self.completed_times.epochs
+        if len(epochs) == 0:
+            return None
+        return period_index(epochs[-1], self.period_length)
+
+    def rebuild_streak(self) -> Optional[StreakPeriod]:
+        """
+        Rebuilds the state of the current run from completed_times in a single pass.
+        Returns the longest run on the way (the latest one on ties), None if never completed.
+        """
+        self._run_start = 0
+        self._run_length = 0
+        self._last_period = None
+        # (length, start, end) of the longest run
+        best = (0, 0, 0)
+        for e in self.completed_times.epochs:
+            p = period_index(e, self.period_length)
+            if self._last_period is None or p > self._last_period + 1:
+                self._run_start = e
+                self._run_length = 1
+            elif p == self._last_period + 1:
+                self._run_length += 1
+            self._last_period = p
+            if self._run_length >= best[0]:
+                best = (self._run_length, self._run_start, e)
+        self._seen = len(self.completed_times)
+        if best[0] == 0:
+            return None
+        return StreakPeriod(best[0], from_epoch(best[1]), from_epoch(best[2]))
+
+    def complete(self, now: Optional[datetime] = None):
+        """
+        Sets self.longest_streak if necessary after completing habit.
+        Completes at now if given (e.g. when replaying a journal), otherwise at datetime.now().
+        """
+        if now is None:
+            now = datetime.now()
+        now = now.replace(microsecond=0)
         self.completed = True
         self.streak_length += 1
+
+        if self._seen != len(self.completed_times):
+            self.rebuild_streak()
+        e = to_epoch(now)
+        p = period_index(e, self.period_length)
         self.completed_times.append(now)
-        
-        if len(self.completed_times) == 1:
-            self.longest_streak = StreakPeriod(1, now, now)
-            return
-
-        # Current known beginning
-        beginning = now
-        length = 0
-        # Iterate in reverse (ie. newest to oldest)
-        for dt in reversed(self.completed_times):
-            delta = beginning - dt
-            if (self.period_length == PeriodLength.daily and delta > timedelta(days=1))\
-            or (self.period_length == PeriodLength.weekly and delta > timedelta(days=7)):
-                break
-            length += 1
-            beginning = dt
-
-        newstreak = StreakPeriod(length, beginning, now)
+
+        if self._last_period is None or p > self._last_period + 1:
+            # New run
+            self._run_start = e
+            self._run_length = 1
+            self._last_period = p
+        elif p == self._last_period + 1:
+            self._run_length += 1
+            self._last_period = p
+        elif p < self._last_period:
+            # Completed in the past, somewhere in the middle of the history
+            self.rebuild_streak()
+        self._seen = len(self.completed_times)
+
+        newstreak = StreakPeriod(self._run_length, from_epoch(self._run_start), self.completed_times[-1])
         if self.longest_streak is None or newstreak.length >= self.longest_streak.length:
             self.longest_streak = newstreak
 
-            
+    def add_completions(self, times: Iterable[datetime], now: Optional[datetime] = None) -> list[datetime]:
+        """
+        Adds the completions at times (in any order), e.g. when importing a history.
+        Times the habit was already completed at are skipped.
+
+        Unlike calling complete for every time, the times are merged into
+        completed_times at once and the streaks are recomputed once,
+        so adding k times to a history of n takes O(n + k log k).
+        streak_length and completed are set for the current period of now
+        (datetime.now() if not given), like update would.
+        Returns the added times, sorted.
+        """
+        added = self.completed_times.merge(times)
+        if not added:
+            return added
+        longest = self.rebuild_streak()
+        if now is None:
+            now = datetime.now()
+        cur = period_index(to_epoch(now), self.period_length)
+        assert self._last_period is not None
+        self.completed = self._last_period >= cur
+        self.streak_length = self._run_length if self._last_period >= cur - 1 else 0
+        if longest is not None and (self.longest_streak is None or longest.length >= self.longest_streak.length):
+            self.longest_streak = longest
+        return added
@@ -0,0 +1,83 @@
+"""Provides a top-k leaderboard used for the streak rankings of the habit tracker."""
+from typing import Optional
+import heapq
+
+class Leaderboard:
+    """
+    Ranks names by an integer score, highest first (ties by name).
+
+    Backed by a heap with lazy deletion: changing or removing a score
+    only pushes a new entry (O(log n)) and old entries are skipped when
+    they reach the top, so nothing is ever sorted as a whole.
+
+    Attributes
+    ----------
+    scores: dict[str, int]
+        The current score of every ranked name.
+    heap: list[tuple[int, str]]
+        Entries of (-score, name), possibly outdated.
+
+    Methods
+    -------
+    set(name: str, score: int)
+    remove(name: str)
+    top(n: int) -> list[tuple[str, int]]
+    """
+    scores: dict[str, int]
+    heap: list[tuple[int, str]]
+
+    def __init__(self, scores: Optional[dict[str, int]] = None):
+        """
+        Constructor for Leaderboard.
+        Builds the heap of scores in O(n).
+        """
+        self.scores = dict(scores or {})
+        self.heap = [(-s, n) for n, s in self.scores.items()]
+        heapq.heapify(self.heap)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def set(self, name: str, score: int):
+        """
+        Sets the score of name, adding it if needed.
+        """
+        if self.scores.get(name) == score:
+            return
+        self.scores[name] = score
+        heapq.heappush(self.heap, (-score, name))
+        self.compact()
+
+    def remove(self, name: str):
+        """
+        Removes name from the leaderboard, if it is ranked.
+        """
+        if self.scores.pop(name, None) is not None:
+            self.compact()
+
+    def compact(self):
+        """
+        Helper method that rebuilds the heap once it holds mostly outdated entries.
+        """
+        if len(self.heap) > 2 * len(self.scores) + 16:
+            self.heap = [(-s, n) for n, s in self.scores.items()]
+            heapq.heapify(self.heap)
+
+    def top(self, n: int) -> list[tuple[str, int]]:
+        """
+        Returns the (name, score) of the n highest ranked names.
+        Takes O(n log size), outdated entries found on the way are dropped.
+        """
+        found: list[tuple[int, str]] = []
+        seen: set[str] = set()
+        while self.heap and len(found) < n:
+            entry = heapq.heappop(self.heap)
+            s, name = entry
+            # Outdated or duplicate entry
+            if self.scores.get(name) != -s or name in seen:
+                continue
+            seen.add(name)
+            found.append(entry)
+        for entry in found:
+            heapq.heappush(self.heap, entry)
+        return [(name, -s) for s, name in found]
@@ -1,7 +1,142 @@
-"""Provides a log method for debugging."""
-def log(string: str):
+"""
+Provides leveled, buffered logging for debugging.
+
+Configured once at import time from the environment:
+    HABITS_LOG       The level to log at (debug, info, warning, error), off if unset.
+    HABITS_LOG_FILE  The file to write to, 'Log' by default.
+
+Records are kept in a ring buffer of the last CAPACITY records and appended
+to the file in batches, every FLUSH_EVERY records, every FLUSH_INTERVAL seconds
+(see flush_due) and at exit. The file is truncated once, when logging is set up.
+Messages are formatted with '%' only when they are written, so
+log("%r", habit) costs nothing but the call if the record is never written.
+
+When logging is off, every function is bound to a no-op at import time,
+arguments that are expensive to compute can be guarded with 'if ENABLED:'.
+"""
+from typing import Any, Optional
+from collections import deque
+from threading import Lock
+import atexit
+import os
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+NAMES = {v: k.upper() for k, v in LEVELS.items()}
+
+# Number of records kept in memory.
+CAPACITY = 1024
+# Number of pending records that triggers a flush.
+FLUSH_EVERY = 256
+# Seconds after which flush_due flushes pending records.
+FLUSH_INTERVAL = 5.0
+
+LEVEL: Optional[int] = LEVELS.get(os.environ.get("HABITS_LOG", "").lower())
+ENABLED = LEVEL is not None
+FILE = os.environ.get("HABITS_LOG_FILE", "Log")
+
+# (time, level, message, args)
+Record = tuple[float, int, str, tuple]
+ring: deque[Record] = deque(maxlen=CAPACITY)
+pending: list[Record] = []
+lock = Lock()
+# Held while writing to FILE, so batches from different threads are written in order.
+file_lock = Lock()
+last_flush = time.monotonic()
+
+def format_record(record: Record) -> str:
     """
-    A helper method for logging to a file.
+    Formats record as a line (without newline).
     """
-    with open("Log", "w") as log_file:
-        log_file.write(string + '\n')
+    t, level, msg, args = record
+    if args:
+        try:
+            msg = msg % args
+        except (TypeError, ValueError) as e:
+            msg = f"{msg!r} % {args!r} failed: {e}"
+    stamp = time.strftime("%H:%M:%S", time.localtime(t)) + f".{int(t * 1000) % 1000:03}"
+    return f"{stamp} {NAMES.get(level, level)} {msg}"
+
+def records() -> list[str]:
+    """
+    Returns the formatted records in the ring buffer, oldest first.
+    """
+    with lock:
+        return [format_record(r) for r in ring]
+
+def flush():
+    """
+    Appends all pending records to FILE at once.
+    """
+    global last_flush
+    with file_lock:
+        with lock:
+            last_flush = time.monotonic()
+            if not pending:
+                return
+            batch = pending[:]
+            pending.clear()
+        with open(FILE, "a") as f:
+            f.write("".join(format_record(r) + "\n" for r in batch))
+
+def emit(level: int, msg: str, args: tuple):
+    """
+    Helper method for recording a message, flushes every FLUSH_EVERY records.
+    """
+    assert LEVEL is not None
+    if level < LEVEL:
+        return
+    r = (time.time(), level, msg, args)
+    with lock:
+        ring.append(r)
+        pending.append(r)
+        full = len(pending) >= FLUSH_EVERY
+    if full:
+        flush()
+
+if ENABLED:
+    def log(msg: str, *args: Any, level: int = DEBUG):
+        """
+        Logs msg % args at level (DEBUG by default).
+        """
+        emit(level, msg, args)
+
+    def debug(msg: str, *args: Any):
+        """Logs msg % args at DEBUG."""
+        emit(DEBUG, msg, args)
+
+    def info(msg: str, *args: Any):
+        """Logs msg % args at INFO."""
+        emit(INFO, msg, args)
+
+    def warning(msg: str, *args: Any):
+        """Logs msg % args at WARNING."""
+        emit(WARNING, msg, args)
+
+    def error(msg: str, *args: Any):
+        """Logs msg % args at ERROR."""
+        emit(ERROR, msg, args)
+
+    def flush_due():
+        """
+        Flushes if FLUSH_INTERVAL seconds passed since the last flush.
+        Meant to be called regularly, e.g. when idle.
+        """
+        if pending and time.monotonic() - last_flush >= FLUSH_INTERVAL:
+            flush()
+
+    # Only the records of this run
+    open(FILE, "w").close()
+    atexit.register(flush)
+else:
+    def log(msg: str, *args: Any, level: int = DEBUG):
+        """Does nothing, logging is off."""
+
+    def noop(*args: Any, **kwargs: Any):
+        """Does nothing, logging is off."""
+
+    debug = info = warning = error = flush_due = noop
@@ -1,5 +1,10 @@
 """This module is the entry point for the habit tracker."""
-from tui import Tui
+import time
+# NOTE: Taken before any other import, so they count towards the startup time.
+STARTED = time.perf_counter()
+import sys
+
+import cli
 
 # TODO:
 # ╭―――――――――――――――――――――――――――╮
@@ -17,13 +22,28 @@ from tui import Tui
 # Maybe at some point
 # - Json storage
 # - Save as, read from
-# - Use cLi args
 # - Rename habits
 # - Better naming
 # - Exception (raising and handling?)
 # - Use filter() method? Probably unnecessary
-if __name__ == "__main__":
+def main():
+    """
+    Runs the command given on the command line (see 'python main.py --help'),
+    or the Tui if there is none.
+    With --profile-startup, the Tui only draws the first frame and prints how long it took.
+    """
+    args = cli.parse_args()
+    if args.command is not None:
+        sys.exit(cli.run(args))
+
+    # NOTE: Imported here, pulls in blessed which is slow to import.
+    from tui import Tui
     t = Tui()
-    t.run()
+    t.run(args.file, started=STARTED, profile_startup=args.profile_startup, backup=args.backup)
+    if args.profile_startup:
+        print(f"First frame after {t.first_frame * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
 
 # NOTE: I do not know if how I document stuff is correct/good.
@@ -1,12 +1,28 @@
 """Provides storage interface and implementations for habit tracker."""
-from typing import Protocol, Optional
+from typing import BinaryIO, ContextManager, Protocol, Optional, TYPE_CHECKING
+from collections.abc import Container, Iterable, Iterator, Sequence
+from contextlib import contextmanager, nullcontext
+from array import array
+from itertools import groupby, repeat
+from operator import itemgetter
 from pathlib import Path
 from enum import StrEnum
 from datetime import datetime
+import io
+import json
+import mmap
+import struct
+import os
+import stat
 import sys
 
-from habit import Habit, PeriodLength, StreakPeriod
-from log import log
+if TYPE_CHECKING:
+    # NOTE: Imported when needed to keep startup fast.
+    import sqlite3
+
+from habit import Habit, PeriodLength, StreakPeriod, Completions, EPOCH, to_epoch, from_epoch
+from log import log, warning
+from timing import timed
 
 class StorageKind(StrEnum):
     """
@@ -14,8 +30,40 @@ class StorageKind(StrEnum):
 
     Current supported values:
         org
+        sqlite
+        binary
     """
     org = "Org"
+    sqlite = "SQLite"
+    binary = "Binary"
+
+def parse_timestamp(s: str) -> datetime:
+    """
+    Parses a timestamp in the fixed 'YYYY-MM-DD HH:MM:SS' layout used by the org files.
+
+    Equivalent to datetime.strptime(s, "%Y-%m-%d %H:%M:%S") for well formed input,
+    but a lot faster, which matters as it is called once per completion line.
+    """
+    if len(s) != 19 or s[10] != ' ':
+        raise ValueError(f"Invalid timestamp: '{s}'")
+    return datetime.fromisoformat(s)
+
+# date.toordinal of 1970-01-01, the day of epoch 0 (see to_epoch)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+def parse_epochs(timestamps: list[str]) -> array:
+    """
+    Parses timestamps like parse_timestamp, returning their epochs (see to_epoch) as an array('q').
+
+    Equivalent to to_epoch(parse_timestamp(s)) for every s, but the epochs are computed in one go
+    from the day ordinals and the time fields, without datetime arithmetic.
+    Called on the completion lines of every habit, so it has to be fast.
+    """
+    for s in timestamps:
+        if len(s) != 19 or s[10] != ' ':
+            raise ValueError(f"Invalid timestamp: '{s}'")
+    return array('q', [(t.toordinal() - EPOCH_ORDINAL) * 86400 + t.hour * 3600 + t.minute * 60 + t.second
+                       for t in map(datetime.fromisoformat, timestamps)])
 
 class StorageInterface(Protocol):
     """
@@ -28,17 +76,264 @@ class StorageInterface(Protocol):
     ------
     read(str) -> list[Habit]:
         Reads habits.
+    iter_habits() -> Iterator[Habit]:
+        Reads habits one at a time.
     save(str) -> list[Habit]:
         Saves habits.
+    record_complete(habit: Habit, time: datetime):
+        Records that habit was completed at time.
+    record_completions(habit: Habit, times: list[datetime]):
+        Records that habit was completed at all of times.
+    record_add(habit: Habit):
+        Records that habit was added.
+    record_delete(habit: Habit):
+        Records that habit was deleted.
+    batch() -> ContextManager[None]:
+        Groups the records made in a with block into a single write.
+    read_headers() -> list[Habit]:
+        Reads habits, possibly with only their last completion.
+    read_history(habit: Habit) -> Sequence[datetime]:
+        Reads every completion of habit.
+    close():
+        Releases what the storage holds open, it is not used afterwards.
+
+    The record methods allow implementations to persist single changes
+    instead of rewriting everything on save. They may do nothing.
     """
     def read(self) -> list[Habit]:
         """Reads in the habits."""
         raise NotImplementedError
 
+    def iter_habits(self) -> Iterator[Habit]:
+        """Reads in the habits, yielding each as soon as it is read."""
+        raise NotImplementedError
+
     def save(self, habits: list[Habit]):
         """Save the habits."""
         raise NotImplementedError
 
+    def record_complete(self, habit: Habit, time: datetime):
+        """Record a completion of habit."""
+        raise NotImplementedError
+
+    def record_completions(self, habit: Habit, times: list[datetime]):
+        """Record many completions of habit, see Habit.add_completions."""
+        raise NotImplementedError
+
+    def record_add(self, habit: Habit):
+        """Record a newly added habit."""
+        raise NotImplementedError
+
+    def record_delete(self, habit: Habit):
+        """Record a deleted habit."""
+        raise NotImplementedError
+
+    def batch(self) -> ContextManager[None]:
+        """
+        Returns a context manager deferring the records made inside it,
+        they are written at once when it exits without an exception.
+        """
+        raise NotImplementedError
+
+    def read_headers(self) -> list[Habit]:
+        """
+        Reads in the habits, allowed to only include the last completion
+        in completed_times. See read_history.
+        """
+        raise NotImplementedError
+
+    def read_history(self, habit: Habit) -> Sequence[datetime]:
+        """Reads in all completions of habit."""
+        raise NotImplementedError
+
+    def close(self):
+        """Releases open files and connections."""
+        raise NotImplementedError
+
+def temp_name(file: Path) -> Path:
+    """
+    Helper method for a random, hidden name next to file, for a temporary file.
+    """
+    return file.with_name(f".{file.name}.{os.urandom(8).hex()}.tmp")
+
+def atomic_write(file: Path, data: bytes, backup: bool = False):
+    """
+    Atomically replaces the content of file with data.
+
+    data is written to a temporary file in the same directory, which is
+    synced to disk and renamed over file, so a crash at any point leaves
+    either the old or the new file, never a partial one.
+    If backup is set, the old file is kept as 'bk.<file>'.
+    """
+    tmp = temp_name(file)
+    # Like any new file, the kernel applies the umask to the mode
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if file.exists():
+            os.chmod(tmp, stat.S_IMODE(file.stat().st_mode))
+            if backup:
+                # A hard link keeps the old file without copying it,
+                # renamed over the old backup so there always is one
+                link = temp_name(file)
+                os.link(file, link)
+                try:
+                    os.replace(link, file.with_name("bk." + file.name))
+                except BaseException:
+                    link.unlink(missing_ok=True)
+                    raise
+        os.replace(tmp, file)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    # Make the rename itself durable
+    if hasattr(os, "O_DIRECTORY"):
+        dfd = os.open(file.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
+
+class OrgBlock:
+    """
+    The fields of a habit read so far from a block of an org file.
+
+    Attributes
+    ----------
+    name, symbol, completed, created, streak, longest_streak, period:
+        The fields of the habit, None until read.
+    read_ls: bool
+        If the longest streak has been read (it may be None).
+    completed_times: list[str]
+        The timestamps of the completions read so far, parsed by habit (see parse_epochs).
+
+    Methods
+    -------
+    habit() -> Optional[Habit]
+    """
+    __slots__ = ("name", "symbol", "completed", "created", "streak", "longest_streak",
+                 "read_ls", "period", "completed_times")
+    name: Optional[str]
+    symbol: Optional[str]
+    completed: Optional[bool]
+    created: Optional[datetime]
+    streak: Optional[int]
+    longest_streak: Optional[StreakPeriod]
+    read_ls: bool
+    period: Optional[PeriodLength]
+    completed_times: list[str]
+
+    def __init__(self):
+        self.name = self.symbol = self.completed = self.created = None
+        self.streak = self.longest_streak = self.period = None
+        self.read_ls = False
+        self.completed_times = []
+
+    def habit(self) -> Optional[Habit]:
+        """
+        Returns the Habit if every necessary field has a value.
+        """
+        if self.name and self.symbol and self.period and self.created and self.streak is not None \
+                and self.read_ls and self.completed is not None:
+            return Habit(self.name, self.symbol, self.period, self.created, self.streak, self.completed,
+                         Completions.from_epochs(parse_epochs(self.completed_times)), self.longest_streak)
+        return None
+
+def parse_org(lines: Iterable[str], file: Path) -> Iterator[Habit]:
+    """
+    Yields the habits of the lines of an org file.
+    A habit block ends at an empty line or the next headline.
+    file is only used for error messages.
+    """
+    block: Optional[OrgBlock] = None
+
+    for line in lines:
+        # NOTE: line keeps newline character
+        # Dispatch on the first character, completion lines by far
+        # the most common, so they are checked first.
+        c = line[:1]
+
+        # Completed times
+        if c == '-':
+            if block is not None and line.startswith('- ['):
+                block.completed_times.append(line[3:22])
+
+        elif c == ':':
+            if block is None:
+                continue
+
+            # Creation date
+            if line.startswith(':created: ['):
+                block.created = parse_timestamp(line[11:30])
+
+            # Streak
+            elif line.startswith(':streak: '):
+                block.streak = int(line[9:])
+
+            # Longest streak
+            elif line.startswith(':longest streak: '):
+                block.read_ls = True
+                rest = line[17:]
+                if rest.strip() == "None":
+                    continue
+                nr, _, rest = rest.partition(' ')
+                d1, _, d2 = rest.partition(';')
+                block.longest_streak = StreakPeriod(int(nr), parse_timestamp(d1[1:20]),
+                                                    parse_timestamp(d2[1:20]))
+
+            # Period length
+            elif line.startswith(':period: '):
+                l = line[9:].rstrip('\n')
+                if l == "Daily":
+                    block.period = PeriodLength.daily
+                elif l == "Weekly":
+                    block.period = PeriodLength.weekly
+                else:
+                    sys.exit(f"Unkown PeriodLength in file: {file}")
+
+            # :PROPERTIES: and :END: are ignored
+
+        # Completed, symbol, name
+        elif c == '*' and line.startswith('* '):
+            # NOTE: Only relevant if not newline separated Habits
+            if block is not None and (h := block.habit()) is not None:
+                yield h
+            block = OrgBlock()
+
+            [_, _,rest] = line.partition(' ')
+            [t, _, rest] = rest.partition(' ')
+            [block.symbol, _, name] = rest.partition(' ')
+            block.name = name[:-1]
+            if t == "TODO":
+                block.completed = False
+            elif t == "DONE":
+                block.completed = True
+            else:
+                sys.exit(f"Unkown completed state in file: {file}")
+
+        elif line.strip() == "":
+            # An empty line inside a block is skipped
+            if block is not None and (h := block.habit()) is not None:
+                yield h
+                block = None
+
+    if block is not None and (h := block.habit()) is not None:
+        yield h
+
+def parse_org_chunk(file: Path, begin: int, end: int) -> list[Habit]:
+    """
+    Reads the habits between the byte offsets begin and end of an org file,
+    begin has to be the start of a headline (or of the file).
+    Run in worker processes by OrgStorage.iter_snapshot.
+    """
+    with open(file, "rb") as f:
+        f.seek(begin)
+        text = f.read(end - begin).decode()
+    return list(parse_org(io.StringIO(text), file))
+
 class OrgStorage:
     """
     A class used to parse org files as storage for habits.
@@ -48,14 +343,56 @@ class OrgStorage:
     ----------
     file: Path
         the Path to the file that will be read from and saved to.
+    journal: Optional[Path]
+        If set, the Path of the append-only journal next to file.
+        Completions, additions and deletions are appended to it as they happen
+        and replayed on top of file when reading.
+        Saving only rewrites file (and empties the journal)
+        once the journal is larger than compact_threshold bytes.
+    compact_threshold: int
+        Size of the journal in bytes at which save compacts it into file.
+    parallel_threshold: int
+        Size of file in bytes from which on it is parsed by multiple processes.
+    workers: Optional[int]
+        Number of processes for parsing, defaults to the number of cores.
+    offsets: Optional[tuple[tuple[int, int], dict[str, tuple[int, int]]]]
+        The cached index of habit blocks (see index), after the modification time (ns)
+        and size of file it belongs to. One tuple, so other threads never see half an update.
+    partial: set[str]
+        Names of habits read by read_headers, whose history is not complete.
+    backup: bool
+        If set, the previous org file is kept as 'bk.<file>' whenever it is rewritten.
+    cache: Optional[BinaryStorage]
+        If set, a binary snapshot of file ('<file>.bin') that is read instead of file
+        while the modification time and size of file match.
+    pending: Optional[list[str]]
+        Journal lines recorded inside batch, appended when it ends.
+    unjournaled: bool
+        If appending to the journal failed, the next save then rewrites file.
     """
     file: Path
+    journal: Optional[Path] = None
+    compact_threshold: int
+    parallel_threshold: int
+    workers: Optional[int]
+    offsets: Optional[tuple[tuple[int, int], dict[str, tuple[int, int]]]] = None
+    partial: set[str]
+    backup: bool
+    cache: Optional["BinaryStorage"] = None
+    pending: Optional[list[str]] = None
+    unjournaled: bool = False
 
-    def __init__(self, file: str):
+    # Chunks per parsing process, more than one so a slow chunk does not hold up the others
+    CHUNKS_PER_WORKER = 4
+
+    def __init__(self, file: str, journal: bool = False, compact_threshold: int = 1 << 16,
+                 parallel_threshold: int = 32 << 20, workers: Optional[int] = None,
+                 backup: bool = False, cache: bool = False):
         """
         Constructor for Orgstorage.
         Checks if file is an org file (by checking extension (so not actually xD)),
         if so sets self.file to given file.
+        If journal is True, changes are recorded in '<file>.journal'.
         """
         # TODO: Raise exceptions
         if Path(file).exists() and not Path(file).is_file():
@@ -63,136 +400,535 @@ class OrgStorage:
         if Path(file).suffix != ".org":
             sys.exit(f"Wrong File Format: Expected org, got: {file}")
         self.file = Path(file)
+        if journal:
+            self.journal = self.file.with_name(self.file.name + ".journal")
+        self.compact_threshold = compact_threshold
+        self.parallel_threshold = parallel_threshold
+        self.workers = workers
+        self.partial = set()
+        self.backup = backup
+        if cache:
+            self.cache = BinaryStorage(str(self.file.with_name(self.file.name + ".bin")))
 
+    @timed("OrgStorage.read")
     def read(self) -> list[Habit]:
-        """Read in habits from an org file."""
+        """
+        Read in habits from an org file.
+        Replays the journal on top if there is one.
+        """
+        return list(self.iter_habits())
+
+    def iter_habits(self) -> Iterator[Habit]:
+        """
+        Yields the habits of the org file one at a time, each as soon as its block ends,
+        so the whole file never has to be held in memory.
+        The journal (which is small) is read first and applied to every habit,
+        habits only added in the journal are yielded last.
+        """
+        entries = self.journal_entries()
+        for h in self.iter_snapshot():
+            h = self.apply(h.name, h, entries.pop(h.name, []))
+            if h is not None:
+                yield h
+        for name, es in entries.items():
+            h = self.apply(name, None, es)
+            if h is not None:
+                yield h
+
+    def read_snapshot(self) -> list[Habit]:
+        """Read in habits from the org file only, ignoring the journal."""
+        return list(self.iter_snapshot())
+
+    def iter_snapshot(self) -> Iterator[Habit]:
+        """
+        Yields the habits of the org file only, ignoring the journal.
+        If there is a cache, it is read instead or rebuilt, see cached_snapshot.
+        Files of at least parallel_threshold bytes are parsed in chunks
+        by a pool of processes, see chunks.
+        """
         if not self.file.exists():
-            return []
-
-        with open(self.file, "r") as f:
-            habits: list[Habit] = list()
-
-            name = None
-            symbol = None
-            completed = None
-            created = None
-            streak = None
-            longest_streak = None
-            period = None
-            completed_times: list[datetime] = []
-
-            # If longest_streak has been read or not
-            read_ls = False
-
-            AlreadyAdded = False
-
-            def hb(read_ls: bool, completed_times: list[datetime]) -> Optional[Habit]:
-                """
-                A helper method for building a Habit if every necessary field has a value.
-                """
-                # log("hb compl times: " + str(completed_times))
-                if not AlreadyAdded and name and symbol and period and created and streak is not None and read_ls and completed is not None:
-                    read_ls = False
-                    return Habit(name, symbol, period, created, streak, completed, completed_times, longest_streak)
-                return None
+            return
+        if self.cache is not None:
+            yield from self.cached_snapshot()
+            return
+        yield from self.parse()
+
+    def source(self) -> tuple[int, int]:
+        """Helper method for the modification time (ns) and size of the org file."""
+        st = self.file.stat()
+        return (st.st_mtime_ns, st.st_size)
+
+    def cached_snapshot(self) -> list[Habit]:
+        """
+        Reads the habits of the org file from the cache if it is up to date,
+        otherwise parses the org file and rebuilds the cache.
+        """
+        assert self.cache is not None
+        source = self.source()
+        if self.cache.read_source() == source:
+            return self.cache.read()
+        habits = list(self.parse())
+        self.update_cache(habits, source)
+        return habits
+
+    def update_cache(self, habits: list[Habit], source: Optional[tuple[int, int]] = None):
+        """
+        Helper method for writing habits to the cache, as the snapshot of the org file.
+        The cache is only a copy, so failing to write it is ignored.
+        """
+        assert self.cache is not None
+        self.cache.source = self.source() if source is None else source
+        try:
+            self.cache.save(habits)
+        except OSError as e:
+            warning("Could not write cache %s: %s", self.cache.file, e)
+
+    def parse(self) -> Iterator[Habit]:
+        """Helper method parsing the habits of the org file, see iter_snapshot."""
+        size = self.file.stat().st_size
+        workers = self.workers or os.cpu_count() or 1
+        if size < self.parallel_threshold or workers == 1:
+            with open(self.file, "r") as f:
+                yield from parse_org(f, self.file)
+            return
 
+        # NOTE: Imported here, only needed for huge files.
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        # Forking copies locks held by other threads (e.g. of BackgroundStorage or log),
+        # which the children would wait on forever.
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        offsets = self.chunks(size, workers * self.CHUNKS_PER_WORKER)
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method)) as pool:
+            # map keeps the order of the chunks, so habits are yielded in file order
+            for habits in pool.map(parse_org_chunk, repeat(self.file), offsets, offsets[1:]):
+                yield from habits
+
+    def chunks(self, size: int, n: int) -> list[int]:
+        """
+        Splits the org file into about n chunks of similar size.
+        Returns the byte offsets of their beginnings followed by size,
+        every chunk beginning with a headline, so it can be parsed on its own.
+        """
+        offsets = [0]
+        with open(self.file, "rb") as f:
+            for k in range(1, n):
+                pos = max(size * k // n, offsets[-1])
+                f.seek(pos)
+                # Find the next headline, reading on until there is one
+                buf = b""
+                while True:
+                    block = f.read(1 << 16)
+                    buf += block
+                    i = buf.find(b"\n* ")
+                    if i != -1 or not block:
+                        break
+                if i == -1:
+                    break
+                offsets.append(pos + i + 1)
+                if offsets[-1] == offsets[-2]:
+                    offsets.pop()
+        offsets.append(size)
+        return offsets
+
+    def journal_entries(self) -> dict[str, list[list]]:
+        """
+        Reads the journal, returning its entries grouped by habit name,
+        in the order the names first appear.
+        A last line without newline is still being appended (or was cut off) and skipped.
+        """
+        entries: dict[str, list[list]] = {}
+        if self.journal is None:
+            return entries
+        try:
+            f = open(self.journal, "r")
+        except FileNotFoundError:
+            return entries
+        with f:
             for line in f:
-                # log(f"'{line.rstrip()}': read_ls: {read_ls}")
-                # log("\n\nLocals:\n" + repr(locals()) + "\n\n")
-                # NOTE: line keeps newline character
-                if line.startswith(':PROP') or line.startswith(':END') or line.startswith('# '):
+                if not line.endswith("\n"):
+                    break
+                if line.strip() == "":
                     continue
+                entry = json.loads(line)
+                if entry[0] not in ("complete", "completions", "add", "delete"):
+                    sys.exit(f"Unknown journal entry in: {self.journal}")
+                entries.setdefault(entry[1], []).append(entry)
+        return entries
 
-                # Completed, symbol, name
-                if line.startswith('* '):
-                    # NOTE: Only relevant if not newline separated Habits
-                    h = hb(read_ls, completed_times)
-                    if not AlreadyAdded and h is not None:
-                        habits.append(h)
-                        completed_times = list()
-                    AlreadyAdded = False
-
-                    [_, _,rest] = line.partition(' ')
-                    [t, _, rest] = rest.partition(' ')
-                    [symbol, _, name] = rest.partition(' ')
-                    name = name[:-1]
-                    if t == "TODO":
-                        completed = False
-                    elif t == "DONE":
-                        completed = True
-                    else:
-                        sys.exit(f"Unkown completed state in file: {self.file}")
-
-                # Creation date
-                elif line.startswith(':created: ['):
-                    [_, _, date] = line.partition(':created: [')
-                    end = date.find(']\n')
-                    created = datetime.strptime(date[:end], "%Y-%m-%d %H:%M:%S")
-
-                # Streak
-                elif line.startswith(':streak: '):
-                    start = line.find(' ')
-                    streak = int(line[start:])
-
-                # Longest streak
-                elif line.startswith(':longest streak: '):
-                    read_ls = True
-                    _, _, rest = line.partition(' ')
-                    _, _, rest = rest.partition(' ')
-                    if rest.strip() == "None":
+    @staticmethod
+    def apply(name: str, h: Optional[Habit], entries: list[list]) -> Optional[Habit]:
+        """
+        Applies the journal entries of the habit called name to h (None if it does not exist).
+        Returns the resulting habit, None if it got deleted.
+        Entries already contained in h are skipped,
+        so replaying is safe even if compaction got interrupted.
+        """
+        for entry in entries:
+            match entry[0]:
+                case "complete":
+                    if h is None:
                         continue
-                    nr, _, rest = rest.partition(' ')
-                    d1, _, d2 = rest.partition(';')
-                    # log("d1 " + d1)
-                    # log("d1 slice" + d1[1:-1])
-                    dt1 = datetime.strptime(d1[1:-1], "%Y-%m-%d %H:%M:%S")
-                    # log("d2" + d2)
-                    # log("d2 slice" + d2[1:-2])
-                    dt2 = datetime.strptime(d2[1:-2], "%Y-%m-%d %H:%M:%S")
-                    longest_streak = StreakPeriod(int(nr), dt1, dt2)
-
-                # Period length
-                elif line.startswith(':period: '):
-                    start = line.find(' ') + 1
-                    l = line[start:-1]
-                    if l == "Daily":
-                        period = PeriodLength.daily
-                    elif l == "Weekly":
-                        period = PeriodLength.weekly
-                    else:
-                        sys.exit(f"Unkown PeriodLength in file: {self.file}")
-
-                # Completed times
-                elif line.startswith('- '):
-                    _, _, dt = line.partition(' ')
-                    # log(dt)
-                    completed_times.append(datetime.strptime(dt[1:-2], "%Y-%m-%d %H:%M:%S"))
-                    # sys.exit("Impl completed times")
-
-                elif line.strip() == "":
-                    h = hb(read_ls, completed_times)
+                    t = parse_timestamp(entry[2])
+                    lcd = h.last_completed_date()
+                    if lcd is None or lcd < t:
+                        h.complete(t)
+                        if len(entry) > 3:
+                            # The streak after completing, h may be from before a reset
+                            # by HabitTracker.update, which is not journaled
+                            h.streak_length = entry[3]
+                case "completions":
+                    if h is None:
+                        continue
+                    # Times already completed at are skipped
+                    h.add_completions(map(parse_timestamp, entry[2]))
+                case "add":
                     if h is not None:
-                        habits.append(h)
-                        AlreadyAdded = True
-                        completed_times = list()
+                        continue
+                    _, _, symbol, period, created = entry
+                    h = Habit(name, symbol, PeriodLength(period), parse_timestamp(created),
+                              0, False, list())
+                case "delete":
+                    h = None
+        return h
+
+    def replay(self, habits: list[Habit]):
+        """
+        Applies the entries of the journal to habits, in place.
+        """
+        entries = self.journal_entries()
+        replayed = [self.apply(h.name, h, entries.pop(h.name, [])) for h in habits]
+        replayed += [self.apply(name, None, es) for name, es in entries.items()]
+        habits[:] = [h for h in replayed if h is not None]
+
+    def append(self, entry: list[str]):
+        """Appends a single entry to the journal, if journaling is enabled."""
+        if self.journal is None:
+            return
+        if self.pending is not None:
+            self.pending.append(json.dumps(entry) + "\n")
+            return
+        self.write_journal(json.dumps(entry) + "\n")
+
+    def write_journal(self, lines: str):
+        """Helper method for appending lines to the journal, remembering if it failed."""
+        assert self.journal is not None
+        try:
+            with open(self.journal, "a") as f:
+                f.write(lines)
+        except BaseException:
+            self.unjournaled = True
+            raise
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Collects the journal entries recorded in the with block and appends them in one write."""
+        self.pending = []
+        try:
+            yield
+            if self.pending and self.journal is not None:
+                self.write_journal("".join(self.pending))
+        finally:
+            self.pending = None
+
+    def record_complete(self, habit: Habit, time: datetime):
+        """Journals a completion of habit at time, with the streak of habit after it."""
+        self.append(["complete", habit.name, str(time.replace(microsecond=0)), habit.streak_length])
+
+    def record_completions(self, habit: Habit, times: list[datetime]):
+        """Journals the completions of habit at times as a single entry."""
+        self.append(["completions", habit.name, [str(t.replace(microsecond=0)) for t in times]])
+
+    def record_add(self, habit: Habit):
+        """Journals the addition of habit."""
+        self.append(["add", habit.name, habit.symbol, str(habit.period_length),
+                     str(habit.creation_date)])
+
+    def record_delete(self, habit: Habit):
+        """Journals the deletion of habit."""
+        self.partial.discard(habit.name)
+        self.append(["delete", habit.name])
+
+    @staticmethod
+    def mapped(f: BinaryIO) -> mmap.mmap:
+        """Helper method for mapping f, the opened org file, into memory read only, it must not be empty."""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def index(self, f: Optional[BinaryIO] = None) -> dict[str, tuple[int, int]]:
+        """
+        Returns the byte offsets (begin, end) of the block of every habit in the org file.
+        If f, the opened org file, is given, the offsets are those of f,
+        even if a write on another thread replaced the org file since it was opened.
+
+        The headlines are found by scanning the memory mapped file for b"\\n* ",
+        only the headlines themselves are decoded.
+        The index is cached in memory and in the sidecar file '<file>.index',
+        both only used while the modification time and size of the org file match.
+        """
+        if f is None:
+            if not self.file.exists():
+                return {}
+            with open(self.file, "rb") as f:
+                return self.index(f)
+        st = os.fstat(f.fileno())
+        key = (st.st_mtime_ns, st.st_size)
+        offsets = self.cached_index(key)
+        if offsets is not None:
+            return offsets
+
+        offsets = {}
+        if st.st_size > 0:
+            with self.mapped(f) as m:
+                offsets = {name: (begin, end) for name, begin, end in self.scan(m)}
+        try:
+            with open(self.file.with_name(self.file.name + ".index"), "w") as sc:
+                json.dump({"mtime_ns": key[0], "size": key[1],
+                           "blocks": [[n, b, e] for n, (b, e) in offsets.items()]}, sc)
+        except OSError:
+            # The sidecar is only a cache
+            pass
+        self.offsets = (key, offsets)
+        return offsets
+
+    def cached_index(self, key: tuple[int, int]) -> Optional[dict[str, tuple[int, int]]]:
+        """
+        Helper method for the index of the org file with the modification time (ns) and size key,
+        from memory or the sidecar file. None if neither holds it.
+        """
+        cached = self.offsets
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        try:
+            with open(self.file.with_name(self.file.name + ".index"), "r") as sc:
+                data = json.load(sc)
+            if (data["mtime_ns"], data["size"]) != key:
+                return None
+            offsets = {name: (begin, end) for name, begin, end in data["blocks"]}
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        self.offsets = (key, offsets)
+        return offsets
+
+    @staticmethod
+    def scan(m: mmap.mmap) -> Iterator[tuple[str, int, int]]:
+        """
+        Helper method finding the habit blocks in the memory mapped org file m,
+        yielding the name, begin and end of each as soon as it is found.
+        """
+        if m[:2] == b"* ":
+            begin = 0
+        else:
+            begin = m.find(b"\n* ") + 1
+            if begin == 0:
+                return
+        while True:
+            i = m.find(b"\n* ", begin)
+            end = len(m) if i == -1 else i + 1
+            nl = m.find(b"\n", begin, end)
+            headline = m[begin:end if nl == -1 else nl].decode()
+            # '* TODO symbol name'
+            yield headline.split(' ', 3)[-1], begin, end
+            if i == -1:
+                return
+            begin = end
+
+    @staticmethod
+    def block(m: mmap.mmap, begin: int, end: int, full: bool) -> bytes:
+        """
+        Helper method for the bytes of the habit block between begin and end.
+        Unless full, only the headline, properties and last completion are included.
+        """
+        if full:
+            return m[begin:end]
+        p = m.find(b"\n:END:", begin, end)
+        head_end = end if p == -1 else min(p + 7, end)
+        head = m[begin:head_end]
+        k = m.rfind(b"\n- [", head_end - 1, end)
+        if k == -1:
+            return head
+        nl = m.find(b"\n", k + 1, end)
+        return head + m[k + 1:end if nl == -1 else nl + 1]
+
+    def read_habit(self, name: str) -> Optional[Habit]:
+        """
+        Reads in the habit called name with its full history, if it exists.
+        Only its block of the org file is decoded, see index.
+        The journal is applied on top.
+        """
+        return self.read_habits([name]).get(name)
 
-        h = hb(read_ls, completed_times)
-        if h is not None:
-            habits.append(h)
+    def read_habits(self, names: Iterable[str]) -> dict[str, Habit]:
+        """
+        Like read_habit for every name in names, returning the habits that exist by name.
+        The journal and the index are only read once.
+        """
+        names = list(names)
+        if not names:
+            return {}
+        # The journal first, a compaction meanwhile replaces file before it empties the journal
+        entries = self.journal_entries()
+        parsed: dict[str, Optional[Habit]] = {}
+        if self.file.exists():
+            # Index and blocks of the same file, even if it is replaced meanwhile
+            with open(self.file, "rb") as f:
+                offsets = self.index(f)
+                blocks = [(name, offsets[name]) for name in names if name in offsets]
+                if blocks:
+                    with self.mapped(f) as m:
+                        for name, (begin, end) in blocks:
+                            text = self.block(m, begin, end, full=True).decode()
+                            parsed[name] = next(parse_org(io.StringIO(text), self.file), None)
+        habits: dict[str, Habit] = {}
+        for name in names:
+            h = self.apply(name, parsed.get(name), entries.get(name, []))
+            if h is not None:
+                habits[name] = h
+        return habits
 
+    def read_headers(self) -> list[Habit]:
+        """
+        Read in habits with only their last completion, from the cache if it is
+        up to date, otherwise from the org file using index.
+        Habits completed in the journal are read completely,
+        as completing needs their history.
+        If the cache is outdated, everything is read, as rebuilding it needs that anyway.
+        """
+        if self.cache is not None and self.file.exists() and self.cache.read_source() != self.source():
+            return self.read()
+        entries = self.journal_entries()
+        full = {name for name, es in entries.items() if any(e[0] in ("complete", "completions") for e in es)}
+        if self.cache is not None:
+            snapshot: Iterable[Habit] = self.cache.read(headers=True, full=full) if self.file.exists() else []
+        else:
+            snapshot = self.iter_headers(full)
+        habits: list[Habit] = []
+        for h in snapshot:
+            name = h.name
+            h = self.apply(name, h, entries.pop(name, []))
+            if h is not None:
+                habits.append(h)
+                if name not in full:
+                    self.partial.add(name)
+        for name, es in entries.items():
+            h = self.apply(name, None, es)
+            if h is not None:
+                habits.append(h)
         return habits
 
+    def iter_headers(self, full: Container[str]) -> Iterator[Habit]:
+        """
+        Helper method for read_headers, yielding the habits of the org file with
+        only their last completion (see index), except the ones named in full.
+        """
+        if not self.file.exists():
+            return
+        with open(self.file, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                return
+            offsets = self.cached_index((st.st_mtime_ns, st.st_size))
+            with self.mapped(f) as m:
+                # Without an index, the blocks are found while they are read,
+                # so only the part of the file up to the last habit needed is scanned
+                blocks = self.scan(m) if offsets is None else ((n, b, e) for n, (b, e) in offsets.items())
+                for name, begin, end in blocks:
+                    text = self.block(m, begin, end, name in full).decode()
+                    h = next(parse_org(io.StringIO(text), self.file), None)
+                    if h is not None:
+                        yield h
+
+    def read_summary(self) -> list[Habit]:
+        """
+        Quickly reads in habits for display only, e.g. for the first frame while
+        the file is still being read. Must not be saved.
+
+        Only the headline, properties and last completion of every habit are read,
+        from the cache if it is up to date, otherwise from the org file (see index),
+        the rest of the file is never touched. The journal is replayed on top.
+        """
+        return list(self.iter_summary())
+
+    def iter_summary(self) -> Iterator[Habit]:
+        """
+        Like read_summary, yielding every habit as soon as it is read,
+        so the habits after the ones needed are never read.
+        """
+        if self.cache is not None and self.file.exists() and self.cache.read_source() == self.source():
+            snapshot = self.cache.iter_read(headers=True)
+        else:
+            snapshot = self.iter_headers(())
+        # As replay does
+        entries = self.journal_entries()
+        for h in snapshot:
+            replayed = self.apply(h.name, h, entries.pop(h.name, []))
+            if replayed is not None:
+                yield replayed
+        for name, es in entries.items():
+            replayed = self.apply(name, None, es)
+            if replayed is not None:
+                yield replayed
+
+    def read_history(self, habit: Habit) -> Sequence[datetime]:
+        """
+        Read in all completions of habit, see read_habit.
+        Habits that were not read by read_headers already have them.
+        """
+        if habit.name not in self.partial:
+            return habit.completed_times
+        h = self.read_habit(habit.name)
+        return [] if h is None else h.completed_times
+
+    @timed("OrgStorage.save")
     def save(self, habits: list[Habit]):
-        """Saves habits to an org file."""
-        with open(self.file, "w") as f:
-        
+        """
+        Saves habits to an org file.
+        When journaling, the org file is only rewritten once the journal
+        has grown past compact_threshold, as the journal already holds every change,
+        or if a change could not be journaled.
+        """
+        if self.journal is not None and self.file.exists() and not self.unjournaled:
+            if not self.journal.exists() or self.journal.stat().st_size < self.compact_threshold:
+                return
+        self.compact(habits)
+
+    def compact(self, habits: list[Habit]):
+        """Writes habits to the org file and empties the journal."""
+        self.write(habits)
+        if self.journal is not None:
+            self.journal.unlink(missing_ok=True)
+        self.unjournaled = False
+        if self.pending is not None:
+            # Already part of habits
+            self.pending.clear()
+
+    def write(self, habits: list[Habit]):
+        """
+        Writes habits to the org file.
+        Habits read by read_headers get their history from the old file first
+        (read in one go, see read_habits), merged with the completions made (or imported) since.
+        habits themselves are not changed, the merged histories only go to the file and the cache.
+        """
+        old = self.read_habits(h.name for h in habits if h.name in self.partial)
+        if old:
+            merged: list[Habit] = []
             for h in habits:
-                # log(str(h))
-                if h.completed:
-                    t = "DONE"
-                else:
-                    t = "TODO"
-                org = f"""
+                o = old.get(h.name)
+                if o is not None and len(o.completed_times) > 0:
+                    history = o.completed_times
+                    history.merge(h.completed_times)
+                    h = h.copy(history=False)
+                    h.completed_times = history
+                merged.append(h)
+            habits = merged
+
+        parts: list[str] = []
+        for h in habits:
+            # log(str(h))
+            if h.completed:
+                t = "DONE"
+            else:
+                t = "TODO"
+            parts.append(f"""
 * {t} {h.symbol} {h.name}
 :PROPERTIES:
 :created: [{h.creation_date}]
@@ -200,8 +936,362 @@ class OrgStorage:
 :longest streak: {h.longest_streak}
 :period: {h.period_length}
 :END:
-"""
-                f.write(org)
-                for time in h.completed_times:
-                    time = time.replace(microsecond=0)
-                    f.write(f"- [{time}]\n")
+""")
+            parts.extend([f"- [{time.replace(microsecond=0)}]\n" for time in h.completed_times])
+        atomic_write(self.file, "".join(parts).encode(), self.backup)
+        if self.cache is not None:
+            self.update_cache(habits)
+
+    def close(self):
+        """Does nothing, files are only open while they are read or written."""
+
+class SqliteStorage:
+    """
+    A class used to store habits in an SQLite database.
+    Implements StorageInterface.
+
+    Habits are stored in the habits table, every completion is one row in
+    the completions table, indexed by (habit_id, time).
+    Completions, additions and deletions are written as they are recorded,
+    so save only has to update the habit rows and never rewrites completions.
+
+    Attributes
+    ----------
+    file: Path
+        the Path to the database.
+    db: sqlite3.Connection
+        The connection to the database.
+    batching: bool
+        If set, the record methods run in the transaction of batch instead of their own.
+    """
+    file: Path
+    db: "sqlite3.Connection"
+    batching: bool = False
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS habits (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        symbol TEXT NOT NULL,
+        period TEXT NOT NULL,
+        created TEXT NOT NULL,
+        streak INTEGER NOT NULL,
+        completed INTEGER NOT NULL,
+        ls_length INTEGER,
+        ls_begin TEXT,
+        ls_end TEXT
+    );
+    CREATE TABLE IF NOT EXISTS completions (
+        habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+        time TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS completions_habit_time ON completions(habit_id, time);
+    """
+    HEADER_COLUMNS = "name, symbol, period, created, streak, completed, ls_length, ls_begin, ls_end"
+
+    def __init__(self, file: str):
+        """
+        Constructor for SqliteStorage.
+        Checks the extension of file, opens the database and creates the tables if needed.
+        """
+        import sqlite3
+
+        if Path(file).exists() and not Path(file).is_file():
+            sys.exit("Path given to SqliteStorage is not a file.")
+        if Path(file).suffix not in (".db", ".sqlite", ".sqlite3"):
+            sys.exit(f"Wrong File Format: Expected db, sqlite or sqlite3, got: {file}")
+        self.file = Path(file)
+        # NOTE: Can be used from a BackgroundStorage thread, which serializes all access.
+        self.db = sqlite3.connect(self.file, check_same_thread=False)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        with self.db:
+            self.db.executescript(self.SCHEMA)
+
+    @staticmethod
+    def header(h: Habit) -> tuple:
+        """Helper method for the values of the habit row of h, without id."""
+        ls = h.longest_streak
+        return (h.name, h.symbol, str(h.period_length), str(h.creation_date),
+                h.streak_length, int(h.completed),
+                None if ls is None else ls.length,
+                None if ls is None else str(ls.begin.replace(microsecond=0)),
+                None if ls is None else str(ls.end.replace(microsecond=0)))
+
+    @staticmethod
+    def habit(row: tuple, completed_times: list[datetime]) -> Habit:
+        """Helper method for building a habit from a habit row without id."""
+        name, symbol, period, created, streak, completed, ls_length, ls_begin, ls_end = row
+        ls = None
+        if ls_length is not None:
+            ls = StreakPeriod(ls_length, parse_timestamp(ls_begin), parse_timestamp(ls_end))
+        return Habit(name, symbol, PeriodLength(period), parse_timestamp(created),
+                     streak, bool(completed), completed_times, ls)
+
+    def read(self) -> list[Habit]:
+        """Read in habits with all completions from the database."""
+        return list(self.iter_habits())
+
+    def iter_habits(self) -> Iterator[Habit]:
+        """
+        Yields the habits with all completions one at a time,
+        streaming the rows of a single query ordered by habit.
+        """
+        rows = self.db.execute(f"""SELECT h.id, {self.HEADER_COLUMNS}, c.time FROM habits h
+                               LEFT JOIN completions c ON c.habit_id = h.id ORDER BY h.id, c.time""")
+        for _, group in groupby(rows, key=itemgetter(0)):
+            first = next(group)
+            times = [] if first[-1] is None else [parse_timestamp(first[-1])]
+            times.extend(parse_timestamp(row[-1]) for row in group)
+            yield self.habit(first[1:-1], times)
+
+    def read_headers(self) -> list[Habit]:
+        """
+        Read in habits from the database with only their last completion.
+        Uses the completions index, so it does not touch the rest of the history.
+        """
+        habits = []
+        for row in self.db.execute(f"""SELECT {self.HEADER_COLUMNS},
+                                       (SELECT max(time) FROM completions c WHERE c.habit_id = h.id)
+                                       FROM habits h ORDER BY id"""):
+            last = row[-1]
+            habits.append(self.habit(row[:-1], [] if last is None else [parse_timestamp(last)]))
+        return habits
+
+    def read_history(self, habit: Habit) -> list[datetime]:
+        """Read in all completions of habit."""
+        return [parse_timestamp(t) for (t,) in self.db.execute(
+            "SELECT time FROM completions WHERE habit_id = (SELECT id FROM habits WHERE name = ?) ORDER BY time",
+            (habit.name,))]
+
+    def save(self, habits: list[Habit]):
+        """
+        Saves habits to the database.
+        Updates the rows of known habits, completions of habits new to the database
+        are inserted and habits not in habits are deleted.
+        """
+        with self.db:
+            known = {name for (name,) in self.db.execute("SELECT name FROM habits")}
+            names = {h.name for h in habits}
+            self.db.executemany("DELETE FROM habits WHERE name = ?", [(n,) for n in known - names])
+            for h in habits:
+                self.db.execute(f"""INSERT INTO habits ({self.HEADER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                ON CONFLICT(name) DO UPDATE SET
+                                symbol = excluded.symbol, period = excluded.period, created = excluded.created,
+                                streak = excluded.streak, completed = excluded.completed,
+                                ls_length = excluded.ls_length, ls_begin = excluded.ls_begin, ls_end = excluded.ls_end""",
+                                self.header(h))
+                if h.name not in known:
+                    self.insert_completions(h, h.completed_times)
+
+    def insert_completions(self, habit: Habit, times: list[datetime]):
+        """Helper method for inserting completions of habit, without committing."""
+        self.db.executemany("INSERT INTO completions SELECT id, ? FROM habits WHERE name = ?",
+                            [(str(t.replace(microsecond=0)), habit.name) for t in times])
+
+    def update_header(self, habit: Habit):
+        """Helper method for updating the row of habit, without committing."""
+        self.db.execute("""UPDATE habits SET streak = ?, completed = ?, ls_length = ?, ls_begin = ?, ls_end = ?
+                        WHERE name = ?""", self.header(habit)[4:] + (habit.name,))
+
+    def transaction(self) -> ContextManager:
+        """Helper method for the transaction of a record method, the one of batch while batching."""
+        return nullcontext() if self.batching else self.db
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Runs the record methods called in the with block in a single transaction."""
+        with self.db:
+            self.batching = True
+            try:
+                yield
+            finally:
+                self.batching = False
+
+    def record_complete(self, habit: Habit, time: datetime):
+        """Inserts a completion of habit at time in a single transaction."""
+        with self.transaction():
+            self.insert_completions(habit, [time])
+            self.update_header(habit)
+
+    def record_completions(self, habit: Habit, times: list[datetime]):
+        """Inserts the completions of habit at times in a single transaction."""
+        with self.transaction():
+            self.insert_completions(habit, times)
+            self.update_header(habit)
+
+    def record_add(self, habit: Habit):
+        """Inserts the row of habit."""
+        with self.transaction():
+            self.db.execute(f"INSERT INTO habits ({self.HEADER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            self.header(habit))
+
+    def record_delete(self, habit: Habit):
+        """Deletes habit and (via cascade) its completions."""
+        with self.transaction():
+            self.db.execute("DELETE FROM habits WHERE name = ?", (habit.name,))
+
+    def close(self):
+        """Closes the connection to the database."""
+        self.db.close()
+
+class BinaryStorage:
+    """
+    A class used to store habits in a compact binary file,
+    which can be read without any parsing per completion.
+    Implements StorageInterface.
+
+    Layout, all little endian:
+        MAGIC
+        FILE_HEADER: source mtime (ns), source size, number of habits, size of the string table
+        for every habit: HABIT_HEADER
+        the string table: name and symbol of every habit, utf-8, each followed by a NUL
+        for every habit: its completions as one sorted block of int64 epoch seconds
+    The headers are fixed size and the blocks are read with array.frombytes,
+    so nothing is parsed per completion.
+
+    Changes are only written on save, the record methods do nothing.
+
+    Attributes
+    ----------
+    file: Path
+        the Path to the file that will be read from and saved to.
+    source: tuple[int, int]
+        The modification time (ns) and size of the file this is a snapshot of,
+        (0, 0) if it is not a snapshot. Used by OrgStorage to validate its cache.
+    """
+    file: Path
+    source: tuple[int, int] = (0, 0)
+
+    MAGIC = b"HABITS\x00\x02"
+    FILE_HEADER = struct.Struct("<qqII")
+    # period, created, streak, completed, has longest streak,
+    # its length, begin and end, number of completions
+    HABIT_HEADER = struct.Struct("<BqqBBqqqq")
+    PERIODS = (PeriodLength.daily, PeriodLength.weekly)
+
+    def __init__(self, file: str):
+        """
+        Constructor for BinaryStorage.
+        Checks the extension of file.
+        """
+        if Path(file).exists() and not Path(file).is_file():
+            sys.exit("Path given to BinaryStorage is not a file.")
+        if Path(file).suffix != ".bin":
+            sys.exit(f"Wrong File Format: Expected bin, got: {file}")
+        self.file = Path(file)
+
+    def read_source(self) -> Optional[tuple[int, int]]:
+        """
+        Reads only the source of the file (see source), None if there is no valid file.
+        """
+        try:
+            with open(self.file, "rb") as f:
+                head = f.read(len(self.MAGIC) + self.FILE_HEADER.size)
+        except OSError:
+            return None
+        if len(head) != len(self.MAGIC) + self.FILE_HEADER.size or not head.startswith(self.MAGIC):
+            return None
+        mtime, size, _, _ = self.FILE_HEADER.unpack_from(head, len(self.MAGIC))
+        return (mtime, size)
+
+    def read(self, headers: bool = False, full: Container[str] = ()) -> list[Habit]:
+        """
+        Read in habits from the binary file.
+        If headers is set, habits only get their last completion (see StorageInterface.read_headers),
+        except the ones named in full.
+        """
+        return list(self.iter_read(headers, full))
+
+    def iter_read(self, headers: bool = False, full: Container[str] = ()) -> Iterator[Habit]:
+        """
+        Like read, yielding every habit as soon as it is read.
+        The file is memory mapped, so with headers only the header and string tables
+        and the last completion of every habit are ever read from it.
+        """
+        if not self.file.exists():
+            return
+        with open(self.file, "rb") as f:
+            if os.fstat(f.fileno()).st_size < len(self.MAGIC):
+                sys.exit(f"Not a habits binary file: {self.file}")
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with m:
+            if m[:len(self.MAGIC)] != self.MAGIC:
+                sys.exit(f"Not a habits binary file: {self.file}")
+            pos = len(self.MAGIC)
+            mtime, size, n, strings_size = self.FILE_HEADER.unpack_from(m, pos)
+            self.source = (mtime, size)
+            pos += self.FILE_HEADER.size
+
+            fixed = self.HABIT_HEADER.iter_unpack(m[pos:pos + n * self.HABIT_HEADER.size])
+            pos += n * self.HABIT_HEADER.size
+            strings = m[pos:pos + strings_size].decode().split("\0")
+            pos += strings_size
+
+            for i, (period, created, streak, completed, has_ls, ls_len, ls_begin, ls_end, count) in enumerate(fixed):
+                name = strings[2 * i]
+                end = pos + 8 * count
+                if headers and count > 0 and name not in full:
+                    pos = end - 8
+                epochs = array('q')
+                epochs.frombytes(m[pos:end])
+                if sys.byteorder == "big":
+                    epochs.byteswap()
+                pos = end
+                ls = StreakPeriod(ls_len, from_epoch(ls_begin), from_epoch(ls_end)) if has_ls else None
+                yield Habit(name, strings[2 * i + 1], self.PERIODS[period], from_epoch(created),
+                            streak, bool(completed), Completions.from_epochs(epochs, sort=False), ls)
+
+    def iter_habits(self) -> Iterator[Habit]:
+        """The whole file is read at once anyway, so this iterates over read."""
+        return iter(self.read())
+
+    def save(self, habits: list[Habit]):
+        """Atomically writes habits to the binary file."""
+        headers = []
+        strings = []
+        blocks = []
+        for h in habits:
+            ls = h.longest_streak
+            epochs = h.completed_times.epochs
+            headers.append(self.HABIT_HEADER.pack(
+                self.PERIODS.index(h.period_length), to_epoch(h.creation_date), h.streak_length,
+                h.completed, ls is not None,
+                0 if ls is None else ls.length,
+                0 if ls is None else to_epoch(ls.begin),
+                0 if ls is None else to_epoch(ls.end),
+                len(epochs)))
+            strings.append(f"{h.name}\0{h.symbol}\0")
+            if sys.byteorder == "big":
+                epochs = array('q', epochs)
+                epochs.byteswap()
+            blocks.append(epochs.tobytes())
+        table = "".join(strings).encode()
+        atomic_write(self.file, b"".join([self.MAGIC, self.FILE_HEADER.pack(*self.source, len(habits), len(table)),
+                                          *headers, table, *blocks]))
+
+    def record_complete(self, habit: Habit, time: datetime):
+        """Does nothing, saved on save."""
+
+    def record_completions(self, habit: Habit, times: list[datetime]):
+        """Does nothing, saved on save."""
+
+    def record_add(self, habit: Habit):
+        """Does nothing, saved on save."""
+
+    def record_delete(self, habit: Habit):
+        """Does nothing, saved on save."""
+
+    def batch(self) -> ContextManager[None]:
+        """Nothing to group, the records do nothing."""
+        return nullcontext()
+
+    def read_headers(self) -> list[Habit]:
+        """Reading everything is fast, so this is the same as read."""
+        return self.read()
+
+    def read_history(self, habit: Habit) -> Sequence[datetime]:
+        """Habits read from binary files always have their full history."""
+        return habit.completed_times
+
+    def close(self):
+        """Does nothing, the file is only open while it is read or written."""
@@ -0,0 +1,63 @@
+import random
+import pytest
+from datetime import datetime, timedelta
+import analytics
+from analytics import History
+from habit import Habit, PeriodLength
+
+# A Wednesday
+NOW = datetime(2024, 5, 15, 12, 0, 0)
+MONDAY = datetime(2024, 5, 13)
+
+@pytest.fixture(params=[False, True], ids=["python", "numpy"])
+def use_numpy(request, monkeypatch):
+    if request.param:
+        pytest.importorskip("numpy")
+    monkeypatch.setattr(analytics, "USE_NUMPY", request.param)
+    return request.param
+
+@pytest.fixture
+def habits():
+    created = MONDAY - timedelta(weeks=4)
+    return [\
+            # Every day of the last week, twice on Monday, and today
+            Habit("Daily", "d", PeriodLength.daily, created, 0, False,
+                  [MONDAY - timedelta(days=7 - d) for d in range(7)] + [MONDAY - timedelta(days=7), MONDAY, NOW]),\
+            # Twice in the current week
+            Habit("Weekly", "w", PeriodLength.weekly, created, 0, False, [MONDAY, NOW]),\
+            # Created this week, never completed
+            Habit("New", "n", PeriodLength.daily, MONDAY + timedelta(days=1), 0, False, []),\
+    ]
+
+def test_history(use_numpy, habits):
+    hist = History(habits, weeks=2, now=NOW)
+    # Last week: 7 of 7 days + 0 of 1 week, this week: 2 of 3 days + 1 of 1 week + 0 of 2 days
+    assert hist.week_rates == [7 / 8, 3 / 6]
+    assert hist.habit_rates == [9 / 10, 1 / 2, 0.0]
+    # Two Mondays (one of them twice), Wednesday twice, every other day once
+    assert hist.weekday_counts == [4, 1, 3, 1, 1, 1, 1]
+    assert hist.best_weekday() == 0
+    assert hist.heatmap(0) == [[2, 1, 1, 1, 1, 1, 1], [1, 0, 1, 0, 0, 0, 0]]
+    assert hist.heatmap(2) == [[0] * 7, [0] * 7]
+
+def test_history_empty(use_numpy):
+    hist = History([], weeks=3, now=NOW)
+    assert hist.week_rates == [None, None, None]
+    assert hist.habit_rates == []
+    assert hist.best_weekday() is None
+
+def test_numpy_matches_python(monkeypatch):
+    pytest.importorskip("numpy")
+    rng = random.Random(1)
+    habits = []
+    for i in range(50):
+        created = NOW - timedelta(days=rng.randrange(200))
+        times = sorted(created + timedelta(seconds=rng.randrange(300 * 86400)) for _ in range(rng.randrange(100)))
+        habits.append(Habit(f"Test {i}", "t", rng.choice(list(PeriodLength)), created, 0, False, times))
+    results = []
+    for use in (False, True):
+        monkeypatch.setattr(analytics, "USE_NUMPY", use)
+        hist = History(habits, weeks=20, now=NOW)
+        results.append((hist.week_rates, hist.habit_rates, hist.weekday_counts,
+                        [hist.heatmap(i) for i in range(len(habits))]))
+    assert results[0] == results[1]
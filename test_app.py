@@ -1,7 +1,8 @@
 import pytest
 from datetime import timedelta, datetime
-from habit import Habit, PeriodLength, StreakPeriod
+from habit import Habit, PeriodLength, StreakPeriod, period_index, to_epoch
 from storage import StorageKind, OrgStorage
+import app
 from app import HabitTracker
 
 @pytest.fixture
@@ -46,7 +47,7 @@ def test_get_uncompleted(test_tracker, habits):
     assert t == h
 
 def test_complete(habits, test_tracker):
-    test_tracker.complete(repr(habits[0]))
+    test_tracker.complete(habits[0].name)
     assert test_tracker.habits[0].completed == True
     assert len(test_tracker.habits[0].completed_times) > len(habits[0].completed_times)
 
@@ -56,12 +57,12 @@ def test_add_habit(test_tracker):
     assert repr(test_tracker.habits[3]) == "t Test 4: Daily, Streak: 0"
 
 def test_delete_habit(habits, test_tracker):
-    test_tracker.deleteHabit(repr(habits[1]))
+    test_tracker.deleteHabit(habits[1].name)
     assert str(habits[0]) == str(test_tracker.habits[0])
     assert str(habits[2]) == str(test_tracker.habits[1])
 
 def test_get_habits(habits, test_tracker):
-    h = test_tracker.getHabit(repr(habits[0]))
+    h = test_tracker.getHabit(habits[0].name)
     assert h is not None
     assert str(habits[0]) == str(h)
 
@@ -114,3 +115,226 @@ def test_name_unique(habits, test_tracker):
 
 def test_names_unique(test_tracker):
     assert test_tracker.check_names_unique() == True
+
+def test_lazy_sqlite(tmp_path, habits):
+    file = str(tmp_path / "habits.db")
+    HabitTracker(StorageKind.sqlite, file).storage.save(habits)
+    tracker = HabitTracker(StorageKind.sqlite, file, lazy=True)
+    assert tracker.partial == {h.name for h in habits}
+    h = tracker.getHabit(habits[1].name)
+    assert h is not None
+    assert h.completed_times == habits[1].completed_times
+    assert h.name not in tracker.partial
+
+def test_binary(tmp_path, habits):
+    file = str(tmp_path / "habits.bin")
+    tracker = HabitTracker(StorageKind.binary, file)
+    tracker.habits = habits
+    tracker.complete(habits[0].name)
+    tracker.save()
+    assert [repr(h) for h in HabitTracker(StorageKind.binary, file).habits] == [repr(h) for h in habits]
+
+def test_lazy_org(tmp_path):
+    file = str(tmp_path / "habits.org")
+    now = datetime.now().replace(microsecond=0)
+    times = [now - timedelta(days=d) for d in range(10, 0, -1)]
+    HabitTracker(StorageKind.org, file).storage.save([\
+            Habit("Test 1", "1", PeriodLength.daily, now, 1, False, times, StreakPeriod(10, times[0], times[-1])),\
+            Habit("Test 2", "2", PeriodLength.weekly, now, 0, False, [], None),\
+    ])
+    tracker = HabitTracker(StorageKind.org, file, journal=True, lazy=True)
+    assert tracker.habits[0].completed_times == times[-1:]
+    assert tracker.habits[0].longest_streak.length == 10
+    tracker.complete(tracker.habits[1].name)
+    # Rewriting the file keeps the history that was never loaded, also when done twice
+    calls = []
+    journal_entries = tracker.storage.journal_entries
+    def counted():
+        calls.append(1)
+        return journal_entries()
+    tracker.storage.journal_entries = counted
+    tracker.storage.compact(tracker.habits)
+    assert len(calls) == 1
+    # Without changing the habits passed in
+    assert tracker.habits[0].completed_times == times[-1:]
+    tracker.storage.compact(tracker.habits)
+    assert HabitTracker(StorageKind.org, file).habits[0].completed_times == times
+    h = tracker.getHabit(tracker.habits[0].name)
+    assert h is not None and h.completed_times == times
+
+def test_index(habits, test_tracker):
+    # Habits are referred to by name, which does not change with the streak
+    test_tracker.complete("Test 1")
+    h = test_tracker.habits[0]
+    assert h.completed
+    assert test_tracker.getHabit("Test 1") is h
+    assert test_tracker.by_name["Test 1"] is h
+
+    test_tracker.addHabit("Test 4", "t", PeriodLength.daily)
+    assert not test_tracker.check_name_unique("Test 4")
+    test_tracker.deleteHabit("Test 4")
+    assert test_tracker.check_name_unique("Test 4")
+    assert len(test_tracker.by_name) == 3
+
+    # Unknown names are a miss, without rebuilding the indexes
+    leaderboards = test_tracker.leaderboards
+    assert test_tracker.getHabit(repr(h)) is None
+    test_tracker.complete("Unknown")
+    test_tracker.deleteHabit("Unknown")
+    assert test_tracker.leaderboards is leaderboards
+    assert len(test_tracker.habits) == 3
+
+def test_update_rollover(test_tracker):
+    now = datetime.now().replace(microsecond=0)
+    yesterday = Habit("Yesterday", "y", PeriodLength.daily, now, 2, True,
+                      [now - timedelta(days=2), now - timedelta(days=1)], None)
+    missed = Habit("Missed", "m", PeriodLength.daily, now, 1, True, [now - timedelta(days=3)], None)
+    test_tracker.habits = [yesterday, missed]
+    test_tracker.update()
+    assert not yesterday.completed
+    assert yesterday.streak_length == 2
+    assert not missed.completed
+    assert missed.streak_length == 0
+    # Updating again on the same day must not reset the streak
+    test_tracker.update()
+    assert yesterday.streak_length == 2
+    assert test_tracker.getHabit(missed.name) is missed
+
+def test_update_buckets(test_tracker, monkeypatch):
+    now = datetime.now().replace(microsecond=0)
+    yesterday = Habit("Yesterday", "y", PeriodLength.daily, now, 2, True,
+                      [now - timedelta(days=2), now - timedelta(days=1)], None)
+    today = Habit("Today", "t", PeriodLength.daily, now, 1, True, [now], None)
+    weekly = Habit("Weekly", "w", PeriodLength.weekly, now, 1, True, [now], None)
+    new = Habit("New", "n", PeriodLength.daily, now, 0, False, [], None)
+    test_tracker.habits = [yesterday, today, weekly, new]
+    test_tracker.update()
+    day = period_index(to_epoch(now), PeriodLength.daily)
+    assert test_tracker.buckets[PeriodLength.daily] == {day - 1: {"Yesterday"}, day: {"Today"}}
+    assert "New" not in test_tracker.bucket_of
+    test_tracker.complete(new.name)
+    assert test_tracker.bucket_of["New"] == (PeriodLength.daily, day)
+
+    seen = []
+    rollover = app.rollover
+    def counted(h, current):
+        seen.append(h.name)
+        return rollover(h, current)
+    monkeypatch.setattr(app, "rollover", counted)
+    # Nothing to do before midnight
+    test_tracker.update()
+    assert seen == []
+
+    tomorrow = now + timedelta(days=1)
+    class Tomorrow(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return tomorrow
+    monkeypatch.setattr(app, "datetime", Tomorrow)
+    test_tracker.update()
+    # Only the habits whose period ended
+    expected = ["New", "Today", "Yesterday"]
+    if period_index(to_epoch(tomorrow), PeriodLength.weekly) > period_index(to_epoch(now), PeriodLength.weekly):
+        expected.append("Weekly")
+    assert sorted(seen) == expected
+    assert yesterday.streak_length == 0 and "Yesterday" not in test_tracker.bucket_of
+    assert not today.completed and today.streak_length == 1
+    assert test_tracker.getHabit(today.name) is today
+    seen.clear()
+    test_tracker.update()
+    assert seen == []
+
+def test_journal_reset_streak(tmp_path):
+    file = str(tmp_path / "habits.org")
+    now = datetime.now().replace(microsecond=0)
+    for lazy in (False, True):
+        # A 5 day streak, saved, then 3 days missed and completed again
+        days = [now - timedelta(days=d) for d in range(8, 3, -1)]
+        OrgStorage(file, journal=True).compact([Habit("Daily", "d", PeriodLength.daily, days[0], 5, False, days, None)])
+        tracker = HabitTracker(StorageKind.org, file, journal=True, lazy=lazy)
+        assert tracker.by_name["Daily"].streak_length == 0
+        tracker.complete("Daily")
+        assert tracker.by_name["Daily"].streak_length == 1
+        # The reset by update is not journaled, the completion has the streak after it
+        for reread in (False, True):
+            h = HabitTracker(StorageKind.org, file, journal=True, lazy=reread).by_name["Daily"]
+            assert (h.streak_length, h.completed) == (1, True)
+        assert OrgStorage(file, journal=True).read_summary()[0].streak_length == 1
+
+def test_analytics_cache(habits, test_tracker):
+    a = test_tracker.analytics()
+    assert test_tracker.analytics() is a
+    assert (a.total, a.completed, a.daily, a.weekly) == (3, 1, 2, 1)
+
+    test_tracker.complete(habits[0].name)
+    b = test_tracker.analytics()
+    assert b is not a
+    assert b.completed == 2
+    test_tracker.addHabit("Test 4", "t", PeriodLength.weekly)
+    assert test_tracker.nrWeeklyHabits() == 2
+
+def test_top_streaks(habits, test_tracker):
+    assert [h.name for h in test_tracker.topStreaks(2)] == ["Test 2", "Test 3"]
+    assert [h.name for h in test_tracker.topStreaks(5, PeriodLength.daily)] == ["Test 3", "Test 1"]
+    test_tracker.complete(test_tracker.habits[2].name)
+    assert [h.name for h in test_tracker.topStreaks(1)] == ["Test 3"]
+    test_tracker.deleteHabit(test_tracker.habits[2].name)
+    assert [h.name for h in test_tracker.topLongestStreaks(3)] == ["Test 2", "Test 1"]
+
+def test_history(habits, test_tracker):
+    hist = test_tracker.history(2)
+    assert len(hist.habit_rates) == len(habits)
+    assert test_tracker.history(2) is hist
+    test_tracker.complete(habits[0].name)
+    assert test_tracker.history(2) is not hist
+    assert sum(map(sum, test_tracker.heatmap(test_tracker.habits[0], 2))) == 1
+
+def test_complete_many(tmp_path):
+    file = str(tmp_path / "habits.org")
+    now = datetime.now().replace(microsecond=0)
+    tracker = HabitTracker(StorageKind.org, file, journal=True)
+    tracker.addHabit("Daily", "d", PeriodLength.daily)
+    tracker.addHabit("Weekly", "w", PeriodLength.weekly)
+    days = [now - timedelta(days=d) for d in range(30)]
+    records = [("Daily", t) for t in days] + [("Weekly", now), ("Unknown", now), ("Daily", now)]
+    version = tracker.version
+    assert tracker.complete_many(records) == 31
+    assert tracker.version > version
+    daily = tracker.by_name["Daily"]
+    assert daily.streak_length == 30 and daily.completed
+    assert daily.completed_times == sorted(days)
+    assert tracker.topStreaks(1) == [daily]
+    assert tracker.getHabit(daily.name) is daily
+    assert tracker.complete_many(records) == 0
+
+    # Replayed from the journal, also when lazy
+    for lazy in (False, True):
+        h = HabitTracker(StorageKind.org, file, journal=True, lazy=lazy).getHabit(daily.name)
+        assert h is not None and h.completed_times == daily.completed_times
+    tracker.storage.compact(tracker.habits)
+    assert HabitTracker(StorageKind.org, file).by_name["Daily"].completed_times == daily.completed_times
+
+def test_complete_many_lazy(tmp_path):
+    file = str(tmp_path / "habits.org")
+    now = datetime.now().replace(microsecond=0)
+    times = [now - timedelta(days=d) for d in range(10, 0, -1)]
+    HabitTracker(StorageKind.org, file).storage.save([\
+            Habit("Test 1", "1", PeriodLength.daily, now, 10, False, times, StreakPeriod(10, times[0], times[-1])),\
+    ])
+    tracker = HabitTracker(StorageKind.org, file, journal=True, lazy=True)
+    old = [now - timedelta(days=d, hours=1) for d in (30, 20)]
+    assert tracker.complete_many([("Test 1", t) for t in old]) == 2
+    # Rewriting the file keeps the imported completions in the middle of the history
+    tracker.storage.compact(tracker.habits)
+    assert HabitTracker(StorageKind.org, file).habits[0].completed_times == old + times
+
+def test_complete_many_sqlite(tmp_path, habits):
+    file = str(tmp_path / "habits.db")
+    tracker = HabitTracker(StorageKind.sqlite, file)
+    tracker.storage.save(habits)
+    tracker.read()
+    then = habits[0].creation_date - timedelta(days=3)
+    assert tracker.complete_many([("Test 1", then), ("Test 3", then)]) == 2
+    again = HabitTracker(StorageKind.sqlite, file)
+    assert again.by_name["Test 1"].completed_times == [then]
+    assert again.by_name["Test 3"].completed_times == [then] + list(habits[2].completed_times)
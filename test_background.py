@@ -0,0 +1,136 @@
+import pytest
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Event
+
+from background import BackgroundStorage
+from storage import OrgStorage
+from habit import Habit, PeriodLength
+
+@pytest.fixture
+def test_org(tmp_path):
+    return OrgStorage(str(tmp_path / "habits.org"), journal=True)
+
+def test_writes_in_order(test_org):
+    bg = BackgroundStorage(test_org)
+    h = Habit.new("Test", "T", PeriodLength.daily)
+    bg.save([])
+    bg.record_add(h)
+    now = datetime.now().replace(microsecond=0)
+    h.complete(now)
+    bg.record_complete(h, now)
+    t = bg.read()
+    assert len(t) == 1
+    assert t[0].completed_times == [now]
+    bg.close()
+
+def test_save_snapshot(test_org):
+    bg = BackgroundStorage(test_org)
+    h = [Habit.new("Test", "T", PeriodLength.daily)]
+    bg.save(h)
+    # Changes after save are not part of the snapshot
+    h[0].complete()
+    bg.close()
+    assert test_org.read()[0].completed_times == []
+
+class SlowStorage:
+    def __init__(self):
+        self.saved = []
+        self.release = Event()
+
+    def save(self, habits):
+        self.release.wait()
+        self.saved.append(len(habits))
+
+    def record_add(self, habit):
+        raise ValueError("Failed")
+
+    def read_history(self, habit):
+        return habit.completed_times
+
+    def close(self):
+        pass
+
+def test_coalesce_saves():
+    slow = SlowStorage()
+    bg = BackgroundStorage(slow)
+    bg.save([])
+    # Wait until the worker blocks in the first save
+    while not bg.busy:
+        pass
+    h = Habit.new("Test", "T", PeriodLength.daily)
+    bg.save([h])
+    bg.save([h, h])
+    slow.release.set()
+    bg.flush()
+    assert slow.saved == [0, 2]
+    bg.close()
+
+def test_read_history():
+    slow = SlowStorage()
+    bg = BackgroundStorage(slow)
+    bg.save([])
+    while not bg.busy:
+        pass
+    # Not held up by the save
+    h = Habit.new("Test", "T", PeriodLength.daily)
+    assert bg.read_history(h) == []
+    assert bg.busy
+    slow.release.set()
+    bg.close()
+
+def test_read_history_recorded(test_org):
+    # Waits for the changes of the habit itself
+    bg = BackgroundStorage(test_org)
+    h = Habit.new("Test", "T", PeriodLength.daily)
+    bg.record_add(h)
+    now = datetime.now().replace(microsecond=0)
+    h.complete(now)
+    bg.record_complete(h, now)
+    test_org.partial.add("Test")
+    assert bg.read_history(h.copy(history=False)) == [now]
+    bg.close()
+
+def test_error():
+    slow = SlowStorage()
+    slow.release.set()
+    bg = BackgroundStorage(slow)
+    bg.record_add(Habit.new("Test", "T", PeriodLength.daily))
+    # Not raised from other calls
+    bg.flush()
+    bg.save([])
+    bg.flush()
+    assert bg.idle()
+    assert slow.saved == [0]
+    assert isinstance(bg.take_error(), ValueError)
+    assert bg.take_error() is None
+    bg.close()
+
+class BatchStorage:
+    def __init__(self):
+        self.calls = []
+
+    @contextmanager
+    def batch(self):
+        self.calls.append("begin")
+        yield
+        self.calls.append("end")
+
+    def save(self, habits):
+        self.calls.append("save")
+
+    def record_add(self, habit):
+        self.calls.append(habit.name)
+
+    def close(self):
+        self.calls.append("close")
+
+def test_batch():
+    storage = BatchStorage()
+    bg = BackgroundStorage(storage)
+    with bg.batch():
+        bg.record_add(Habit.new("Test 1", "T", PeriodLength.daily))
+        bg.record_add(Habit.new("Test 2", "T", PeriodLength.daily))
+        assert not bg.queue and not bg.busy
+    bg.close()
+    assert storage.calls == ["begin", "Test 1", "Test 2", "end", "close"]
@@ -0,0 +1,154 @@
+"""
+Benchmarks of the hot paths on generated datasets, see dataset.py and the readme.
+
+Only the small dataset is used by default, others are chosen with
+HABITS_BENCH_SIZES, e.g. HABITS_BENCH_SIZES=small,medium,large.
+"""
+import os
+import sys
+import pytest
+from datetime import timedelta
+
+pytest.importorskip("pytest_benchmark")
+
+import analytics
+import dataset
+from analytics import History
+from app import Analytics, HabitTracker
+from habit import PeriodLength
+from storage import OrgStorage, StorageKind
+
+SIZES = os.environ.get("HABITS_BENCH_SIZES", "small").split(",")
+# Target for drawing the first frame of the Tui, for up to medium datasets
+FIRST_FRAME = 0.05
+# (habits, completions) of the dataset the first frame is always measured on, besides SIZES.
+# Only the last completion of every habit is read for it, so few completions are enough.
+FIRST_FRAME_SIZE = (10_000, 100_000)
+
+@pytest.fixture(scope="module", params=SIZES)
+def org_file(request, tmp_path_factory):
+    file = str(tmp_path_factory.mktemp(request.param) / "habits.org")
+    OrgStorage(file).save(dataset.habits(*dataset.SIZES[request.param]))
+    return file
+
+@pytest.fixture(scope="module")
+def tracker(org_file):
+    return HabitTracker(StorageKind.org, org_file)
+
+@pytest.fixture(params=[False, True], ids=["python", "numpy"])
+def use_numpy(request, monkeypatch):
+    if request.param:
+        pytest.importorskip("numpy")
+    monkeypatch.setattr(analytics, "USE_NUMPY", request.param)
+
+def test_read(benchmark, org_file):
+    benchmark(OrgStorage(org_file).read)
+
+def test_save(benchmark, tracker, tmp_path):
+    benchmark(OrgStorage(str(tmp_path / "habits.org")).save, tracker.habits)
+
+def test_update(benchmark, tracker):
+    benchmark(tracker.update)
+
+def test_complete(benchmark, tracker):
+    # The habit with the longest history, a fresh copy every round
+    # so the history does not grow with the number of rounds
+    h = max(tracker.habits, key=lambda h: len(h.completed_times))
+    benchmark.pedantic(lambda h: h.complete(), setup=lambda: ((h.copy(),), {}), rounds=100)
+
+def test_add_completions(benchmark, tracker):
+    h = max(tracker.habits, key=lambda h: len(h.completed_times))
+    # As many, all new and interleaved with the history
+    times = [t - timedelta(seconds=1) for t in h.completed_times]
+    benchmark.pedantic(lambda h: h.add_completions(times), setup=lambda: ((h.copy(),), {}), rounds=20)
+
+def test_analytics(benchmark, tracker):
+    benchmark(Analytics, tracker.habits)
+
+def test_history(benchmark, tracker, use_numpy):
+    benchmark(History, tracker.habits)
+
+def test_heatmap(benchmark, tracker, use_numpy):
+    hist = History(tracker.habits)
+    benchmark(hist.heatmap, 0)
+
+@pytest.mark.parametrize("period", [None, PeriodLength.daily])
+def test_top_streaks(benchmark, tracker, period):
+    benchmark(tracker.topStreaks, 3, period)
+
+@pytest.mark.parametrize("period", [None, PeriodLength.daily])
+def test_top_longest_streaks(benchmark, tracker, period):
+    benchmark(tracker.topLongestStreaks, 3, period)
+
+@pytest.mark.parametrize("method", [
+    "nrDailyHabits", "nrWeeklyHabits",
+    "currentLongestStreak", "currentLongestDailyStreak", "currentLongestWeeklyStreak",
+    "longestEverStreak", "longestEverDailyStreak", "longestEverWeeklyStreak",
+    "get_daily", "get_weekly",
+])
+def test_analytics_method(benchmark, tracker, method):
+    def changed():
+        # As if a habit changed, so the cached Analytics are recomputed every round
+        tracker.version += 1
+    benchmark.pedantic(getattr(tracker, method), setup=changed, rounds=20)
+
+def test_rank(benchmark, tracker):
+    benchmark(tracker.rank, tracker.habits[0])
+
+@pytest.fixture
+def screen(monkeypatch):
+    """A Tui drawing on a fake terminal into /dev/null."""
+    blessed = pytest.importorskip("blessed")
+    from tui import Tui, Renderer, Viewport
+
+    class FakeTerminal(blessed.Terminal):
+        """An xterm of a fixed size, not connected to anything."""
+        width = 160
+        height = 50
+
+    t = Tui()
+    t.term = FakeTerminal(kind="xterm-256color", force_styling=True)
+    t.renderer = Renderer(t.term)
+    t.viewport = Viewport()
+    with open(os.devnull, "w") as null:
+        monkeypatch.setattr(sys, "stdout", null)
+        yield t
+
+@pytest.fixture
+def tui(screen, tracker):
+    """A Tui on tracker, see screen."""
+    screen.habit_tracker = tracker
+    return screen
+
+def test_draw_table(benchmark, tui):
+    tui.getHabits()
+
+    def redraw():
+        # Everything, not only the rows that changed
+        tui.renderer.invalidate()
+        tui.drawTable()
+    benchmark(redraw)
+
+def test_first_frame(benchmark, screen, org_file, request):
+    def first_frame():
+        screen.renderer.invalidate()
+        screen.drawSummary(org_file)
+    benchmark(first_frame)
+    # The first frame should take at most FIRST_FRAME seconds, not counting imports
+    if benchmark.stats is not None and "large" not in request.node.callspec.id:
+        assert benchmark.stats.stats.median < FIRST_FRAME
+
+@pytest.fixture(scope="module", params=[False, True], ids=["org", "cache"])
+def first_frame_file(request, tmp_path_factory):
+    """An org file of FIRST_FRAME_SIZE, with an up to date binary cache or without any."""
+    file = str(tmp_path_factory.mktemp("first_frame") / "habits.org")
+    OrgStorage(file, cache=request.param).save(dataset.habits(*FIRST_FRAME_SIZE))
+    return file
+
+def test_first_frame_many(benchmark, screen, first_frame_file):
+    def first_frame():
+        screen.renderer.invalidate()
+        screen.drawSummary(first_frame_file)
+    benchmark(first_frame)
+    if benchmark.stats is not None:
+        assert benchmark.stats.stats.median < FIRST_FRAME
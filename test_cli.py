@@ -0,0 +1,112 @@
+import io
+import json
+import subprocess
+import sys
+import pytest
+from datetime import datetime, timedelta
+from cli import parser, parse_args, run, open_tracker
+from habit import Habit, PeriodLength, StreakPeriod
+from storage import SqliteStorage
+
+@pytest.fixture
+def file(tmp_path):
+    f = str(tmp_path / "habits.org")
+    tracker = open_tracker(f)
+    tracker.addHabit("Brush teeth", "b", PeriodLength.daily)
+    tracker.addHabit("Clean up", "c", PeriodLength.weekly)
+    tracker.save()
+    return f
+
+def cli(file, *args):
+    return run(parser().parse_args(["--file", file, *args]))
+
+def test_complete(file):
+    assert cli(file, "complete", "Brush teeth", "Clean up") == 0
+    assert all(h.completed for h in open_tracker(file).habits)
+
+def test_unknown_saves_nothing(file, capsys):
+    assert cli(file, "complete", "Brush teeth", "Nope") == 1
+    assert "Unknown habit: Nope" in capsys.readouterr().err
+    assert not any(h.completed for h in open_tracker(file).habits)
+
+def test_add_delete(file):
+    assert cli(file, "add", "Read", "--symbol", "r", "--period", "daily") == 0
+    assert cli(file, "add", "Read", "--symbol", "r", "--period", "daily") == 1
+    assert cli(file, "delete", "Clean up") == 0
+    assert [h.name for h in open_tracker(file).habits] == ["Brush teeth", "Read"]
+
+def test_list(file, capsys):
+    cli(file, "complete", "Brush teeth")
+    capsys.readouterr()
+    cli(file, "list", "--period", "daily")
+    assert capsys.readouterr().out == "DONE b Brush teeth: Daily, Streak: 1\n"
+    cli(file, "list", "--todo")
+    assert capsys.readouterr().out == "TODO c Clean up: Weekly, Streak: 0\n"
+
+def test_stats_json(file, capsys):
+    cli(file, "complete", "Clean up")
+    capsys.readouterr()
+    cli(file, "stats", "--json")
+    s = json.loads(capsys.readouterr().out)
+    assert (s["total"], s["completed"], s["daily"], s["weekly"]) == (2, 1, 1, 1)
+    assert s["current_longest"]["all"]["name"] == "Clean up"
+    assert s["current_longest"]["daily"]["streak"] == 0
+    assert [h["name"] for h in s["top_streaks"]["weekly"]] == ["Clean up"]
+
+def test_batch(file, monkeypatch):
+    monkeypatch.setattr(sys, "stdin", io.StringIO(
+        "# comment\n"
+        "add Read --symbol r --period weekly\n"
+        "complete 'Brush teeth' Read\n"
+        "\n"
+        "delete 'Clean up'\n"))
+    assert cli(file, "batch") == 0
+    habits = open_tracker(file).habits
+    assert [(h.name, h.completed) for h in habits] == [("Brush teeth", True), ("Read", True)]
+
+def test_no_blessed():
+    out = subprocess.run([sys.executable, "-c", "import cli, sys; print('tui' in sys.modules, 'blessed' in sys.modules)"],
+                         capture_output=True, text=True, check=True).stdout
+    assert out == "False False\n"
+
+def test_batch_all_or_nothing(file, monkeypatch):
+    monkeypatch.setattr(sys, "stdin", io.StringIO("delete 'Clean up'\ncomplete 'Clean up'\n"))
+    assert cli(file, "batch") == 1
+    assert len(open_tracker(file).habits) == 2
+
+def test_batch_sqlite(tmp_path, monkeypatch):
+    file = str(tmp_path / "habits.db")
+    monkeypatch.setattr(sys, "stdin", io.StringIO(
+        "add Read --symbol r --period daily\n"
+        "complete Read\n"))
+    assert cli(file, "batch") == 0
+    # What is stored, not what a lazy tracker reads in
+    habits = SqliteStorage(file).read()
+    assert [(h.name, h.symbol, h.period_length, h.streak_length, h.completed) for h in habits] \
+        == [("Read", "r", PeriodLength.daily, 1, True)]
+    assert len(habits[0].completed_times) == 1
+    assert datetime.now() - habits[0].completed_times[0] < timedelta(minutes=1)
+
+def test_sqlite_lazy(tmp_path):
+    file = str(tmp_path / "habits.db")
+    days = [datetime.now().replace(microsecond=0) - timedelta(days=d) for d in (3, 2, 1)]
+    SqliteStorage(file).save([
+        Habit("Read", "r", PeriodLength.daily, days[0], 3, False, days, StreakPeriod(3, days[0], days[2])),
+        Habit("Walk", "w", PeriodLength.daily, days[0], 3, False, days, StreakPeriod(3, days[0], days[2])),
+    ])
+    tracker = open_tracker(file)
+    # Only the last completions are read in
+    assert tracker.partial == {"Read", "Walk"}
+    assert [len(h.completed_times) for h in tracker.habits] == [1, 1]
+    tracker.close()
+
+    assert cli(file, "complete", "Read") == 0
+    habits = SqliteStorage(file).read()
+    assert [(h.name, h.streak_length, len(h.completed_times)) for h in habits] == [("Read", 4, 4), ("Walk", 3, 3)]
+
+def test_tui_needs_org(capsys):
+    with pytest.raises(SystemExit) as e:
+        parse_args(["--file", "habits.db"])
+    assert e.value.code == 2
+    assert "only supports .org files" in capsys.readouterr().err
+    assert parse_args(["--file", "habits.db", "list"]).command == "list"
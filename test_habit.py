@@ -1,7 +1,7 @@
 import pytest
 from datetime import datetime, timedelta
 
-from habit import PeriodLength, Habit
+from habit import PeriodLength, Habit, StreakPeriod, Completions, to_epoch, from_epoch, period_index
 
 @pytest.fixture
 def test_habit():
@@ -76,3 +76,89 @@ def test_complete_continue_streak(test_habit, completed_times):
     assert test_habit.completed == True
     assert test_habit.streak_length == 2
     assert test_habit.longest_streak.begin != test_habit.longest_streak.end
+
+def test_completions(completed_times):
+    c = Completions(reversed(completed_times))
+    assert len(c) == 3
+    assert c == completed_times
+    assert list(c) == completed_times
+    assert c[-1] == datetime(2023, 4, 8)
+    assert c[:2] == completed_times[:2]
+    assert datetime(2023, 4, 7) in c
+
+    c.append(datetime(2023, 4, 5))
+    assert c[0] == datetime(2023, 4, 5)
+    assert from_epoch(to_epoch(c[0])) == c[0]
+
+def test_completed_times_converted(test_habit, completed_times):
+    test_habit.completed_times = completed_times
+    assert isinstance(test_habit.completed_times, Completions)
+    assert test_habit.completed_times == completed_times
+
+def test_slots(test_habit):
+    assert not hasattr(test_habit, "__dict__")
+    assert not hasattr(StreakPeriod(1, datetime.now(), datetime.now()), "__dict__")
+    # No shared class level list of completed times
+    other = Habit.new("Other", "O", PeriodLength.daily)
+    other.complete()
+    assert len(test_habit.completed_times) == 0
+
+def test_period_index():
+    e = to_epoch
+    assert period_index(e(datetime(2023, 1, 31, 23)), PeriodLength.daily) + 1\
+        == period_index(e(datetime(2023, 2, 1, 1)), PeriodLength.daily)
+    # 2023-01-01 is a sunday, 2023-01-02 a monday
+    assert period_index(e(datetime(2022, 12, 26)), PeriodLength.weekly)\
+        == period_index(e(datetime(2023, 1, 1, 23)), PeriodLength.weekly)
+    assert period_index(e(datetime(2023, 1, 1)), PeriodLength.weekly) + 1\
+        == period_index(e(datetime(2023, 1, 2)), PeriodLength.weekly)
+
+def test_complete_streak_across_year(test_habit):
+    test_habit.complete(datetime(2022, 12, 30, 23))
+    test_habit.complete(datetime(2022, 12, 31, 8))
+    test_habit.complete(datetime(2023, 1, 1, 20))
+    assert test_habit.longest_streak.length == 3
+    assert test_habit.longest_streak.begin == datetime(2022, 12, 30, 23)
+    # Same day does not extend the streak
+    test_habit.complete(datetime(2023, 1, 1, 21))
+    assert test_habit.longest_streak.length == 3
+    assert test_habit.longest_streak.end == datetime(2023, 1, 1, 21)
+
+    test_habit.rebuild_streak()
+    assert test_habit.last_period() == period_index(to_epoch(datetime(2023, 1, 1)), PeriodLength.daily)
+
+def test_merge():
+    c = Completions([datetime(2023, 4, 2), datetime(2023, 4, 5)])
+    added = c.merge([datetime(2023, 4, 6), datetime(2023, 4, 1), datetime(2023, 4, 5), datetime(2023, 4, 3),
+                     datetime(2023, 4, 3)])
+    assert added == [datetime(2023, 4, 1), datetime(2023, 4, 3), datetime(2023, 4, 6)]
+    assert list(c) == [datetime(2023, 4, d) for d in (1, 2, 3, 5, 6)]
+    assert c.merge([datetime(2023, 4, 7)]) == [datetime(2023, 4, 7)]
+    assert c.merge([]) == []
+
+def test_add_completions(test_habit):
+    now = datetime(2023, 4, 20, 12)
+    # Out of order, with a gap on the 10th and two completions on the 12th
+    times = [datetime(2023, 4, d, 8) for d in (19, 6, 7, 8, 9, 11, 12, 13, 14, 15, 16, 17, 18)]
+    times.append(datetime(2023, 4, 12, 20))
+    assert len(test_habit.add_completions(times, now)) == 14
+    assert test_habit.longest_streak.length == 9
+    assert test_habit.longest_streak.begin == datetime(2023, 4, 11, 8)
+    assert test_habit.longest_streak.end == datetime(2023, 4, 19, 8)
+    # Completed yesterday, so the streak goes on but today is still to do
+    assert test_habit.streak_length == 9
+    assert not test_habit.completed
+    # Same as completing one at a time
+    one = Habit("Test", "T", PeriodLength.daily, datetime(2023, 4, 6), 0, False, [], None)
+    for t in sorted(times):
+        one.complete(t)
+    assert one.completed_times == test_habit.completed_times
+    assert str(one.longest_streak) == str(test_habit.longest_streak)
+
+    # Nothing new
+    assert test_habit.add_completions(times, now) == []
+    test_habit.add_completions([now], now)
+    assert test_habit.completed and test_habit.streak_length == 10
+    # Long ago, the current streak is unchanged
+    test_habit.add_completions([datetime(2023, 3, 1)], now)
+    assert test_habit.streak_length == 10 and test_habit.longest_streak.length == 10
@@ -0,0 +1,27 @@
+from leaderboard import Leaderboard
+
+def test_top():
+    board = Leaderboard({"a": 1, "b": 3, "c": 2})
+    assert board.top(2) == [("b", 3), ("c", 2)]
+    assert board.top(5) == [("b", 3), ("c", 2), ("a", 1)]
+
+def test_set_and_remove():
+    board = Leaderboard()
+    board.set("a", 5)
+    board.set("b", 5)
+    board.set("a", 6)
+    board.set("a", 5)
+    # Ties ordered by name
+    assert board.top(3) == [("a", 5), ("b", 5)]
+    board.remove("a")
+    assert board.top(3) == [("b", 5)]
+    assert len(board) == 1
+    board.set("a", 1)
+    assert board.top(3) == [("b", 5), ("a", 1)]
+
+def test_compact():
+    board = Leaderboard({"a": 0})
+    for i in range(100):
+        board.set("a", i)
+    assert len(board.heap) < 50
+    assert board.top(1) == [("a", 99)]
@@ -0,0 +1,94 @@
+import importlib
+import pytest
+from threading import Thread
+import log
+
+@pytest.fixture
+def enabled(tmp_path, monkeypatch):
+    monkeypatch.setenv("HABITS_LOG", "info")
+    monkeypatch.setenv("HABITS_LOG_FILE", str(tmp_path / "Log"))
+    (tmp_path / "Log").write_text("from the last run\n")
+    yield importlib.reload(log)
+    monkeypatch.delenv("HABITS_LOG")
+    monkeypatch.delenv("HABITS_LOG_FILE")
+    importlib.reload(log)
+
+class Counted:
+    calls = 0
+    def __repr__(self):
+        Counted.calls += 1
+        return "counted"
+
+@pytest.fixture
+def disabled(monkeypatch):
+    monkeypatch.delenv("HABITS_LOG", raising=False)
+    yield importlib.reload(log)
+    monkeypatch.undo()
+    importlib.reload(log)
+
+def test_disabled(disabled, tmp_path, monkeypatch):
+    log = disabled
+    monkeypatch.chdir(tmp_path)
+    assert not log.ENABLED
+    log.log("%r", Counted())
+    log.error("nope")
+    log.flush_due()
+    assert Counted.calls == 0
+    assert list(tmp_path.iterdir()) == []
+
+def test_levels_and_lazy(enabled):
+    Counted.calls = 0
+    enabled.debug("hidden %r", Counted())
+    enabled.info("shown %r", Counted())
+    enabled.log("also shown", level=enabled.ERROR)
+    # Nothing is formatted until needed
+    assert Counted.calls == 0
+    records = enabled.records()
+    assert [r.split(" ", 1)[1] for r in records] == ["INFO shown counted", "ERROR also shown"]
+
+def test_flush(enabled):
+    file = enabled.FILE
+    enabled.info("first")
+    enabled.flush()
+    enabled.info("second")
+    enabled.flush()
+    with open(file) as f:
+        assert [l.split(" ", 1)[1] for l in f.read().splitlines()] == ["INFO first", "INFO second"]
+
+def test_flush_threads(enabled, monkeypatch):
+    monkeypatch.setattr(enabled, "FLUSH_EVERY", 10)
+    def work(t):
+        for i in range(100):
+            enabled.info("%d %d", t, i)
+    threads = [Thread(target=work, args=(t,)) for t in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    enabled.flush()
+    with open(enabled.FILE) as f:
+        lines = [l.split(" ")[2:] for l in f.read().splitlines()]
+    assert len(lines) == 400
+    # In order per thread, nothing lost
+    for t in range(4):
+        assert [int(i) for n, i in lines if int(n) == t] == list(range(100))
+
+def test_batched(enabled, monkeypatch):
+    monkeypatch.setattr(enabled, "FLUSH_EVERY", 3)
+    enabled.info("1")
+    enabled.info("2")
+    assert len(enabled.pending) == 2
+    enabled.info("3")
+    assert enabled.pending == []
+    enabled.info("4")
+    monkeypatch.setattr(enabled, "FLUSH_INTERVAL", 0.0)
+    enabled.flush_due()
+    with open(enabled.FILE) as f:
+        assert len(f.read().splitlines()) == 4
+
+def test_ring(enabled):
+    for i in range(enabled.CAPACITY + 10):
+        enabled.info("%d", i)
+    records = enabled.records()
+    assert len(records) == enabled.CAPACITY
+    assert records[0].endswith(" 10")
@@ -1,8 +1,11 @@
+import os
+import sqlite3
+import stat
 import pytest
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from storage import OrgStorage
-from habit import Habit, PeriodLength, StreakPeriod
+from storage import OrgStorage, SqliteStorage, BinaryStorage, parse_timestamp, parse_epochs
+from habit import Habit, PeriodLength, StreakPeriod, to_epoch
 
 @pytest.fixture
 def test_org(tmp_path):
@@ -50,4 +53,333 @@ def test_save_and_read(test_org):
         assert a.creation_date == b.creation_date
     # assert h == test_org.read()
 
+def test_parse_timestamp():
+    s = "2023-04-02 16:34:46"
+    assert parse_timestamp(s) == datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
+    with pytest.raises(ValueError):
+        parse_timestamp("2023-04-02T16:34:46")
+    with pytest.raises(ValueError):
+        parse_timestamp("2023-04-02 16:34")
+
+def test_parse_epochs():
+    s = ["2023-04-02 16:34:46", "1970-01-01 00:00:00", "1969-12-31 23:59:59",
+         "2024-02-29 12:00:01", "2000-03-01 00:00:00", "2099-12-31 23:59:59"]
+    assert list(parse_epochs(s)) == [to_epoch(datetime.strptime(t, "%Y-%m-%d %H:%M:%S")) for t in s]
+    assert len(parse_epochs([])) == 0
+    with pytest.raises(ValueError):
+        parse_epochs(["2023-04-02T16:34:46"])
+    with pytest.raises(ValueError):
+        parse_epochs(["2023-04-02 16:34"])
+    with pytest.raises(ValueError):
+        parse_epochs(["2023-02-29 16:34:46"])
+
 # TODO: Probably more complex unit tests needed but eh
+
+def test_journal_replay(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    org = OrgStorage(str(tmp_path / "habits.org"), journal=True)
+    h = [\
+            Habit("Test 1", "1", PeriodLength.daily, now, 0, False, [], None),\
+            Habit("Test 2", "2", PeriodLength.weekly, now, 0, False, [], None),\
+         ]
+    org.save(h)
+    assert org.journal is not None and not org.journal.exists()
+
+    h[0].complete(now)
+    org.record_complete(h[0], now)
+    org.record_delete(h[1])
+    new = Habit.new("Test 3", "3", PeriodLength.daily)
+    org.record_add(new)
+    # Below threshold, so the org file is not rewritten
+    org.save(h)
+
+    t = org.read()
+    assert [repr(x) for x in t] == [repr(h[0]), repr(new)]
+    assert t[0].completed_times == [now]
+    assert t[0].completed
+
+    # Replaying twice does not complete twice
+    org.replay(t)
+    assert t[0].completed_times == [now]
+
+def test_iter_habits(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    org = OrgStorage(str(tmp_path / "habits.org"))
+    org.save([\
+            Habit("Test 1", "1", PeriodLength.daily, now, 1, True, [now], StreakPeriod(1, now, now)),\
+            Habit("Test 2", "2", PeriodLength.weekly, now, 0, False, [], None),\
+         ])
+    it = org.iter_habits()
+    first = next(it)
+    assert first.name == "Test 1"
+    second = next(it)
+    # The longest streak of a habit does not leak into the next one
+    assert second.longest_streak is None
+    assert list(it) == []
+
+def test_parallel_read(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    org = OrgStorage(str(tmp_path / "habits.org"), parallel_threshold=0, workers=2)
+    h = [Habit(f"Test {i}", str(i), PeriodLength.daily, now, i, i % 2 == 0,
+               [now - timedelta(days=d) for d in range(i, 0, -1)], None) for i in range(20)]
+    org.save(h)
+    offsets = org.chunks(org.file.stat().st_size, 8)
+    assert offsets == sorted(set(offsets)) and len(offsets) > 2
+    t = org.read()
+    assert [str(x) for x in t] == [str(x) for x in h]
+    assert [x.completed_times for x in t] == [x.completed_times for x in h]
+
+def test_offset_index(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    org = OrgStorage(str(tmp_path / "habits.org"), journal=True)
+    h = [Habit(f"Test {i}", str(i), PeriodLength.daily, now, 0, False,
+               [now - timedelta(days=d) for d in range(i, 0, -1)], None) for i in range(3)]
+    org.save(h)
+    index = org.index()
+    assert list(index) == ["Test 0", "Test 1", "Test 2"]
+    assert org.file.read_bytes()[index["Test 1"][0]:].startswith(b"* TODO 1 Test 1\n")
+    # Loaded from the sidecar by a new instance
+    sidecar = tmp_path / "habits.org.index"
+    assert sidecar.exists()
+    assert OrgStorage(str(org.file)).index() == index
+
+    one = org.read_habit("Test 2")
+    assert one is not None and one.completed_times == h[2].completed_times
+    org.record_complete(h[1], now)
+    one = org.read_habit("Test 1")
+    assert one is not None and one.completed_times[-1] == now
+    assert org.read_habit("Nope") is None
+
+    # A changed file invalidates the index
+    org.compact(h[:1])
+    assert list(org.index()) == ["Test 0"]
+    assert list(OrgStorage(str(org.file)).index()) == ["Test 0"]
+
+def test_atomic_write(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    org = OrgStorage(str(tmp_path / "habits.org"), backup=True)
+    h = [Habit("Test 1", "1", PeriodLength.daily, now, 1, True, [now], StreakPeriod(1, now, now))]
+    org.save(h)
+    assert not (tmp_path / "bk.habits.org").exists()
+    first = org.file.read_text()
+    h.append(Habit("Test 2", "2", PeriodLength.weekly, now, 0, False, [], None))
+    org.save(h)
+    assert (tmp_path / "bk.habits.org").read_text() == first
+    assert [str(x) for x in org.read()] == [str(x) for x in h]
+    # No temporary files are left behind
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["bk.habits.org", "habits.org"]
+    second = org.file.read_text()
+    org.save(h[:1])
+    assert (tmp_path / "bk.habits.org").read_text() == second
+
+def test_atomic_write_umask(tmp_path):
+    old = os.umask(0o027)
+    try:
+        OrgStorage(str(tmp_path / "habits.org")).save([])
+    finally:
+        os.umask(old)
+    assert stat.S_IMODE((tmp_path / "habits.org").stat().st_mode) == 0o640
+
+def test_write_failure_keeps_file(tmp_path, monkeypatch):
+    now = datetime.now().replace(microsecond=0)
+    org = OrgStorage(str(tmp_path / "habits.org"))
+    org.save([Habit("Test 1", "1", PeriodLength.daily, now, 0, False, [], None)])
+    before = org.file.read_text()
+    def fail(fd):
+        raise OSError("disk full")
+    monkeypatch.setattr("os.fsync", fail)
+    with pytest.raises(OSError):
+        org.save([])
+    assert org.file.read_text() == before
+    assert [p.name for p in tmp_path.iterdir()] == ["habits.org"]
+
+def test_binary_save_and_read(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    before = now - timedelta(days=1)
+    b = BinaryStorage(str(tmp_path / "habits.bin"))
+    assert b.read() == [] and b.read_source() is None
+    h = [\
+            Habit("Test ä", "ä", PeriodLength.daily, now, 0, False, [], None),\
+            Habit("Test 2", "2", PeriodLength.weekly, now, 1, True, [before, now], StreakPeriod(2, before, now)),\
+         ]
+    b.save(h)
+    t = BinaryStorage(str(b.file)).read()
+    assert [str(x) for x in t] == [str(x) for x in h]
+    assert t[1].completed_times == [before, now]
+    assert t[1].longest_streak is not None and str(t[1].longest_streak) == str(h[1].longest_streak)
+    assert t[0].longest_streak is None
+
+def test_org_cache(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    org = OrgStorage(str(tmp_path / "habits.org"), journal=True, cache=True)
+    h = [Habit("Test 1", "1", PeriodLength.daily, now, 0, False, [], None)]
+    org.compact(h)
+    # Written together with the org file
+    assert org.cache is not None and org.cache.read_source() == org.source()
+    h[0].complete(now)
+    org.record_complete(h[0], now)
+    t = OrgStorage(str(org.file), journal=True, cache=True).read()
+    assert t[0].completed_times == [now]
+
+    # Changing the org file outside invalidates the cache
+    OrgStorage(str(org.file)).write([Habit("Other", "o", PeriodLength.weekly, now, 0, False, [], None)])
+    assert org.cache.read_source() != org.source()
+    assert [x.name for x in org.read()] == ["Other"]
+    assert org.cache.read_source() == org.source()
+
+def test_org_cache_headers(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    times = [now - timedelta(days=d) for d in range(5, 0, -1)]
+    org = OrgStorage(str(tmp_path / "habits.org"), journal=True, cache=True)
+    org.compact([Habit("Test 1", "1", PeriodLength.daily, now, 5, False, times, StreakPeriod(5, times[0], times[-1])),
+                 Habit("Test 2", "2", PeriodLength.daily, now, 0, False, times, None)])
+    org.record_complete(Habit("Test 2", "2", PeriodLength.daily, now, 0, False, [], None), now)
+    t = OrgStorage(str(org.file), journal=True, cache=True)
+    headers = t.read_headers()
+    # Only the last completion, the history stays on disk
+    assert headers[0].completed_times == times[-1:]
+    assert headers[0].longest_streak is not None and headers[0].longest_streak.length == 5
+    assert t.partial == {"Test 1"}
+    assert t.read_history(headers[0]) == times
+    # Completed in the journal, so read completely
+    assert headers[1].completed_times == times + [now]
+
+def test_journal_incomplete(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    org = OrgStorage(str(tmp_path / "habits.org"), journal=True)
+    org.save([Habit("Test 1", "1", PeriodLength.daily, now, 0, False, [], None)])
+    org.record_delete(Habit.new("Test 1", "1", PeriodLength.daily))
+    assert org.journal is not None
+    # An append still being written
+    with open(org.journal, "a") as f:
+        f.write('["add", "Test 2", "2", "Dai')
+    assert org.read() == []
+
+def test_journal_readd(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    org = OrgStorage(str(tmp_path / "habits.org"), journal=True)
+    h = [Habit("Test 1", "1", PeriodLength.daily, now, 0, False, [], None)]
+    org.save(h)
+    org.record_delete(h[0])
+    org.record_add(Habit.new("Test 1", "x", PeriodLength.weekly))
+    t = org.read()
+    assert [(x.name, x.symbol) for x in t] == [("Test 1", "x")]
+
+def test_journal_compact(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    org = OrgStorage(str(tmp_path / "habits.org"), journal=True, compact_threshold=1)
+    h = [Habit("Test 1", "1", PeriodLength.daily, now, 0, False, [], None)]
+    org.save(h)
+    h[0].complete(now)
+    org.record_complete(h[0], now)
+    org.save(h)
+    assert org.journal is not None and not org.journal.exists()
+    assert org.read_snapshot()[0].completed_times == [now]
+
+def test_journal_batch(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    org = OrgStorage(str(tmp_path / "habits.org"), journal=True)
+    h = Habit("Test 1", "1", PeriodLength.daily, now, 0, False, [], None)
+    org.save([])
+    assert org.journal is not None
+    with org.batch():
+        org.record_add(h)
+        h.complete(now)
+        org.record_complete(h, now)
+        # Only written at the end
+        assert not org.journal.exists()
+    assert org.read()[0].completed_times == [now]
+
+    with pytest.raises(ValueError):
+        with org.batch():
+            org.record_delete(h)
+            raise ValueError
+    assert len(org.read()) == 1
+
+def test_journal_failure(tmp_path, monkeypatch):
+    now = datetime.now().replace(microsecond=0)
+    org = OrgStorage(str(tmp_path / "habits.org"), journal=True)
+    h = [Habit("Test 1", "1", PeriodLength.daily, now, 0, False, [], None)]
+    org.save(h)
+    h[0].complete(now)
+    def fail(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr("builtins.open", fail)
+    with pytest.raises(OSError):
+        org.record_complete(h[0], now)
+    monkeypatch.undo()
+    # The completion is not in the journal, so save has to write it
+    org.save(h)
+    assert not org.unjournaled
+    assert org.read()[0].completed_times == [now]
+
+def test_sqlite_save_and_read(tmp_path):
+    db = SqliteStorage(str(tmp_path / "habits.db"))
+    now = datetime.now().replace(microsecond=0)
+    before = now - timedelta(days=1)
+    h = [\
+            Habit("Test 1", "1", PeriodLength.daily, now, 0, False, [], None),\
+            Habit("Test 2", "2", PeriodLength.weekly, now, 1, True, [before, now], StreakPeriod(1, now, now)),\
+         ]
+    db.save(h)
+    assert [str(x) for x in db.read()] == [str(x) for x in h]
+    assert db.read()[1].completed_times == [before, now]
+
+    headers = db.read_headers()
+    assert [str(x) for x in headers] == [str(x) for x in h]
+    assert headers[0].completed_times == []
+    assert headers[1].completed_times == [now]
+    assert db.read_history(headers[1]) == [before, now]
+
+def test_sqlite_record(tmp_path):
+    db = SqliteStorage(str(tmp_path / "habits.db"))
+    now = datetime.now().replace(microsecond=0)
+    h = Habit("Test 1", "1", PeriodLength.daily, now, 0, False, [], None)
+    db.record_add(h)
+    h.complete(now)
+    db.record_complete(h, now)
+    t = db.read()
+    assert str(t[0]) == str(h)
+    assert t[0].completed_times == [now]
+
+    db.record_delete(h)
+    assert db.read() == []
+    assert db.db.execute("SELECT count(*) FROM completions").fetchone() == (0,)
+
+    db.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.read()
+
+def test_sqlite_batch(tmp_path):
+    db = SqliteStorage(str(tmp_path / "habits.db"))
+    other = SqliteStorage(str(tmp_path / "habits.db"))
+    now = datetime.now().replace(microsecond=0)
+    h = Habit("Test 1", "1", PeriodLength.daily, now, 0, False, [], None)
+    with db.batch():
+        db.record_add(h)
+        h.complete(now)
+        db.record_complete(h, now)
+        # A single transaction, committed at the end
+        assert other.read() == []
+    assert other.read()[0].completed_times == [now]
+
+    with pytest.raises(ValueError):
+        with db.batch():
+            db.record_delete(h)
+            raise ValueError
+    assert len(other.read()) == 1
+
+def test_read_summary(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    before = now - timedelta(days=1)
+    org = OrgStorage(str(tmp_path / "habits.org"), journal=True)
+    h = [\
+            Habit("Test 1", "1", PeriodLength.daily, now, 0, False, [], None),\
+            Habit("Test 2", "2", PeriodLength.weekly, now, 1, True, [before, now], StreakPeriod(1, now, now)),\
+         ]
+    org.save(h)
+    org.record_delete(h[0])
+    s = org.read_summary()
+    assert [repr(x) for x in s] == [repr(h[1])]
+    assert s[0].completed
+    assert s[0].completed_times == [now]
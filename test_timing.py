@@ -0,0 +1,37 @@
+import json
+import timing
+from timing import Stats, Span, timed, summary, dump
+
+def test_percentiles():
+    s = Stats()
+    assert s.percentile(0.5) == 0
+    for ns in range(1, 101):
+        s.add(ns * 1000)
+    assert s.count == 100
+    assert s.percentile(0.5) == 51000
+    assert s.percentile(0.95) == 95000
+    assert s.max == 100000
+    assert s.summary()["p95_ms"] == 0.095
+
+def test_window():
+    s = Stats()
+    for ns in range(timing.WINDOW + 10):
+        s.add(ns)
+    assert len(s.durations) == timing.WINDOW
+    assert s.count == timing.WINDOW + 10
+    # max is over all runs, not only the window
+    assert s.max == timing.WINDOW + 9
+
+def test_spans(tmp_path):
+    @timed("test.fn")
+    def fn(x):
+        return x + 1
+    assert fn(1) == 2
+    assert fn.__name__ == "fn"
+    with Span("test.span"):
+        pass
+    s = summary()
+    assert s["test.fn"]["count"] == 1 and s["test.span"]["count"] == 1
+    dump(str(tmp_path / "timing.json"))
+    with open(tmp_path / "timing.json") as f:
+        assert json.load(f)["test.fn"]["count"] == 1
@@ -0,0 +1,169 @@
+"""
+Provides lightweight timing of hot paths, for finding out what makes the app slow.
+
+Every span (see Span and timed) keeps its last WINDOW durations,
+from which p50, p95 and max latencies are computed when asked for.
+
+Configured once at import time from the environment:
+    HABITS_TIMING       If set, the statistics are dumped as JSON to this file at exit.
+    HABITS_TRACEMALLOC  If set, tracemalloc is started and every span also records
+                        the memory it allocated (net and peak, in bytes).
+                        Makes everything a lot slower.
+"""
+from typing import Any, Callable, Optional, TypeVar
+from collections import deque
+from functools import wraps
+import atexit
+import json
+import os
+import time
+import tracemalloc
+
+# Number of durations kept per span.
+WINDOW = 256
+
+FILE: Optional[str] = os.environ.get("HABITS_TIMING") or None
+TRACEMALLOC = bool(os.environ.get("HABITS_TRACEMALLOC"))
+
+class Stats:
+    """
+    The recorded durations of a span.
+
+    Attributes
+    ----------
+    count: int
+        Number of times the span was run.
+    durations: deque[int]
+        The last WINDOW durations in ns.
+    max: int
+        The longest duration in ns, of all runs.
+    allocated: deque[int]
+        The net bytes allocated by the last WINDOW runs, if TRACEMALLOC.
+    peak: int
+        The most bytes allocated at once by a run, if TRACEMALLOC.
+
+    Methods
+    -------
+    add(ns: int)
+    percentile(p: float) -> int
+    summary() -> dict[str, float]
+    """
+    __slots__ = ("count", "durations", "max", "allocated", "peak")
+    count: int
+    durations: deque[int]
+    max: int
+    allocated: deque[int]
+    peak: int
+
+    def __init__(self):
+        self.count = 0
+        self.durations = deque(maxlen=WINDOW)
+        self.max = 0
+        self.allocated = deque(maxlen=WINDOW)
+        self.peak = 0
+
+    def add(self, ns: int):
+        """Records a run that took ns nanoseconds."""
+        self.count += 1
+        self.durations.append(ns)
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, p: float) -> int:
+        """Returns the p-th percentile (0 to 1) of the recent durations in ns, 0 if there are none."""
+        if not self.durations:
+            return 0
+        d = sorted(self.durations)
+        return d[round(p * (len(d) - 1))]
+
+    def summary(self) -> dict[str, float]:
+        """Returns count, p50, p95 and max (in ms), and the allocations if recorded."""
+        s: dict[str, float] = {
+            "count": self.count,
+            "p50_ms": self.percentile(0.5) / 1e6,
+            "p95_ms": self.percentile(0.95) / 1e6,
+            "max_ms": self.max / 1e6,
+        }
+        if self.allocated:
+            s["alloc_bytes"] = sorted(self.allocated)[len(self.allocated) // 2]
+            s["peak_bytes"] = self.peak
+        return s
+
+stats: dict[str, Stats] = {}
+
+def get(name: str) -> Stats:
+    """Returns the Stats of the span called name, adding it if needed."""
+    s = stats.get(name)
+    if s is None:
+        s = stats[name] = Stats()
+    return s
+
+class Span:
+    """
+    A context manager timing its body as the span called name.
+
+        with Span("Tui.input"):
+            ...
+
+    With TRACEMALLOC, the peak of a span containing other spans is only approximate.
+    """
+    __slots__ = ("stats", "start", "memory")
+    stats: Stats
+    start: int
+    memory: int
+
+    def __init__(self, name: str):
+        self.stats = get(name)
+
+    def __enter__(self):
+        if TRACEMALLOC:
+            tracemalloc.reset_peak()
+            self.memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc: Any):
+        self.stats.add(time.perf_counter_ns() - self.start)
+        if TRACEMALLOC:
+            current, peak = tracemalloc.get_traced_memory()
+            self.stats.allocated.append(current - self.memory)
+            self.stats.peak = max(self.stats.peak, peak - self.memory)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+def timed(name: str) -> Callable[[F], F]:
+    """
+    A decorator timing every call of the function as the span called name.
+    """
+    def decorate(fn: F) -> F:
+        s = get(name)
+        if TRACEMALLOC:
+            @wraps(fn)
+            def traced(*args, **kwargs):
+                with Span(name):
+                    return fn(*args, **kwargs)
+            return traced  # type: ignore
+
+        @wraps(fn)
+        def timer(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                s.add(time.perf_counter_ns() - start)
+        return timer  # type: ignore
+    return decorate
+
+def summary() -> dict[str, dict[str, float]]:
+    """Returns the summary of every span that was run, by name."""
+    return {name: s.summary() for name, s in sorted(stats.items()) if s.count > 0}
+
+def dump(file: str):
+    """Writes summary as JSON to file."""
+    with open(file, "w") as f:
+        json.dump(summary(), f, indent=2)
+
+if TRACEMALLOC:
+    tracemalloc.start()
+if FILE is not None:
+    atexit.register(dump, FILE)
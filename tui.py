@@ -2,16 +2,22 @@
 from enum import StrEnum
 from typing import Optional
 from itertools import zip_longest
+from threading import Thread
 import string
 import sys
+import time
 
 from blessed import Terminal
+from blessed.keyboard import Keystroke
 
-from app import HabitTracker
-from storage import StorageKind
-from habit import PeriodLength
+from app import HabitTracker, lstreak, current_periods, rollover
+from background import BackgroundStorage
+from storage import StorageKind, OrgStorage
+from habit import Habit, PeriodLength, from_epoch
+from analytics import DAY, WEEKDAYS
 
-from log import log
+from log import ENABLED, debug, warning, flush_due, records
+from timing import Span, timed, summary
 
 class TuiPage(StrEnum):
     """
@@ -20,35 +26,177 @@ class TuiPage(StrEnum):
     Possible values:
         homepage
         analytics
+        history
         info
+        debug
     """
     homepage = "Home Page"
     analytics = "Analytics"
+    history = "History"
     info = "Habit Information"
+    debug = "Debug"
 
-def printTable(term: Terminal, lhs: list[str], rhs: list[str]):
+def formatTable(term: Terminal, lhs: list[str], rhs: list[str]) -> list[str]:
     """
-    Prints a table with 2 columns (lhs and rhs) on term
+    Formats a table with 2 columns (lhs and rhs) as rows for term
     """
-    printRow(term, "TODO", "DONE")
+    rows = [formatRow(term, "TODO", "DONE")]
     # divider
-    print(term.ljust('', fillchar='-'))
+    rows.append(term.ljust('', fillchar='-'))
     for l, r in zip_longest(lhs, rhs, fillvalue=""):
-        printRow(term, l, r)
+        rows.append(formatRow(term, l, r))
+    return rows
 
 # NOTE:
 # Why print rows instead of columns?
 # Terminal draws from top to bottom, left ro right,
 # thus better to go left to right, than down.
 # With columns have to go to middle for every rhs with isn't great..
-def printRow(term: Terminal, lhs: str, rhs: str):
+def formatRow(term: Terminal, lhs: str, rhs: str) -> str:
     """
-    Prints a row of a table with lhs on the complete left and rhs starting in the middle
+    Formats a row of a table with lhs on the complete left and rhs starting in the middle
     of the terminal.
     """
     w = term.width // 2
-    print(term.move_x(0) + term.ljust(term.truncate(lhs, width=w - 3), width=w - 3) + " | "\
-           + term.ljust(term.truncate(rhs, width=w), width=w))
+    return term.ljust(term.truncate(lhs, width=w - 3), width=w - 3) + " | "\
+           + term.ljust(term.truncate(rhs, width=w), width=w)
+
+class Renderer:
+    """
+    Draws frames on a terminal, only sending the rows that changed since the last frame.
+
+    A frame is a list of lines, one per terminal row starting at the top.
+    Everything is written with a single write and flush per frame.
+
+    Attributes
+    ----------
+    term: Terminal
+    lines: list[str]
+        The last frame drawn.
+    size: tuple[int, int]
+        The width and height of the terminal when the last frame was drawn.
+
+    Methods
+    -------
+    render(lines: list[str], cursor: Optional[tuple[int, int]])
+    invalidate(row: Optional[int])
+    """
+    term: Terminal
+    lines: list[str]
+    size: tuple[int, int]
+
+    # Never part of a line, so an invalidated row always differs
+    INVALID = "\0"
+
+    def __init__(self, term: Terminal):
+        self.term = term
+        self.lines = []
+        self.size = (0, 0)
+
+    def invalidate(self, row: Optional[int] = None):
+        """
+        Forgets what is shown on row (or every row if None),
+        for when something was drawn without the Renderer.
+        """
+        if row is None:
+            self.size = (0, 0)
+        elif row < len(self.lines):
+            self.lines[row] = self.INVALID
+
+    @timed("Renderer.render")
+    def render(self, lines: list[str], cursor: Optional[tuple[int, int]] = None):
+        """
+        Draws lines, moves the cursor to (row, column) and shows it, or hides it if None.
+        """
+        term = self.term
+        out = []
+        size = (term.width, term.height)
+        if size != self.size:
+            # Resized (or first frame), nothing on screen can be trusted.
+            out.append(term.clear())
+            self.lines = []
+            self.size = size
+        lines = [term.truncate(l, width=term.width) for l in lines[:term.height]]
+        for y, line in enumerate(lines):
+            if y >= len(self.lines) or self.lines[y] != line:
+                out.append(term.move_yx(y, 0) + line + term.clear_eol())
+        for y in range(len(lines), len(self.lines)):
+            if self.lines[y] != "":
+                out.append(term.move_yx(y, 0) + term.clear_eol())
+        self.lines = lines + [""] * max(len(self.lines) - len(lines), 0)
+        if cursor is None:
+            out.append(term.hide_cursor)
+        else:
+            out.append(term.move_yx(*cursor) + term.normal_cursor)
+        sys.stdout.write("".join(out))
+        sys.stdout.flush()
+
+class Viewport:
+    """
+    The slice of rows of a list that is visible on screen.
+
+    Scrolls just enough to keep the cursor visible,
+    so only height rows ever have to be formatted.
+
+    Attributes
+    ----------
+    offset: int
+        Index of the first visible row.
+    height: int
+        Number of visible rows.
+
+    Methods
+    -------
+    follow(cursor: int, total: int)
+    visible(rows: list[str]) -> list[str]
+    """
+    offset: int = 0
+    height: int = 1
+
+    def follow(self, cursor: int, total: int):
+        """
+        Scrolls so that the row cursor of total rows is visible.
+        """
+        if cursor < self.offset:
+            self.offset = cursor
+        elif cursor >= self.offset + self.height:
+            self.offset = cursor - self.height + 1
+        self.offset = max(min(self.offset, total - self.height), 0)
+
+    def visible(self, rows: list[str]) -> list[str]:
+        """
+        Returns the visible rows.
+        """
+        return rows[self.offset:self.offset + self.height]
+
+# Seconds to wait for input before a tick (rollover, autosave) happens anyway.
+TICK = 1.0
+# Seconds between checks if the habits are read in, while waiting for them.
+LOAD_POLL = 0.01
+# Seconds without changes after which the habits are saved in the background.
+AUTOSAVE_DELAY = 2.0
+
+# Keys that are matched by their name (e.g. 'key_down') instead of their sequence.
+NAMED_KEYS = {"KEY_UP", "KEY_DOWN", "KEY_LEFT", "KEY_RIGHT",
+              "KEY_PGUP", "KEY_PGDOWN", "KEY_HOME", "KEY_END"}
+
+# Number of weeks shown on the history page and in heatmaps.
+WEEKS = 12
+# Heatmap cells by number of completions on a day.
+HEAT = "·░▒▓█"
+
+def bar(rate: Optional[float], width: int) -> str:
+    """
+    Returns a bar of width characters, filled by rate (0 to 1).
+    """
+    filled = 0 if rate is None else round(rate * width)
+    return "█" * filled + "·" * (width - filled)
+
+def percent(rate: Optional[float]) -> str:
+    """
+    Returns rate (0 to 1) as a right aligned percentage, '-' if it is None.
+    """
+    return "   -" if rate is None else f"{round(rate * 100):3}%"
 
 class Tui:
     """
@@ -66,23 +214,49 @@ class Tui:
     habit_tracker: HabitTracker
     completed: list[str]
     uncompleted: list[str]
+    completed_names: list[str]
+    uncompleted_names: list[str]
+    renderer: Renderer
+    viewport: Viewport
+    storage: BackgroundStorage
+    saved_version: int
+    changed_version: int
+    changed_at: float
+    first_frame: float
+    previous: TuiPage
+    save_error: Optional[str]
+    load_error: Optional[BaseException]
 
     Methods
     -------
-    run()
+    run(file: str, started: Optional[float], profile_startup: bool)
+    load(file: str, backup: bool)
+    waitLoaded(loader: Thread) -> list[Keystroke]
     draw()
-    input()
+    input(key: Optional[Keystroke])
+    tick()
+    save()
+    autosave()
     getHabits()
+    setLists(habits: list[Habit])
+    selected() -> Optional[str]
     get_str(prompt: str) -> str
     get_period() -> PeriodLength
     confirm() -> bool
     warn(warning: str)
+    toggleDebug()
     analyticsInput(inp: str)
+    historyInput(inp: str)
     homepageInput(inp: str)
     infoInput(inp: str)
+    debugInput(inp: str)
+    drawSummary(file: str)
     drawHomepage()
+    drawTable()
     drawAnalytics()
+    drawHistory()
     drawInfopage()
+    drawDebug()
     """
     page: TuiPage = TuiPage.homepage
     term: Terminal
@@ -94,33 +268,125 @@ class Tui:
     habit_tracker: HabitTracker
     completed: list[str]
     uncompleted: list[str]
-
+    # Names of the habits in completed and uncompleted, to refer to them in habit_tracker
+    completed_names: list[str]
+    uncompleted_names: list[str]
+    renderer: Renderer
+    viewport: Viewport
+    # Does the writes of habit_tracker.storage on a background thread
+    storage: BackgroundStorage
+    # HabitTracker.version last saved, last seen and when it was first seen
+    saved_version: int
+    changed_version: int
+    changed_at: float
+    # Seconds from start to the first frame
+    first_frame: float
+    # (HabitTracker.version, filter) the lists were built for
+    lists_for: Optional[tuple[int, Optional[PeriodLength]]] = None
+    # The page to go back to from the debug page
+    previous: TuiPage = TuiPage.homepage
+    # Raised by load
+    load_error: Optional[BaseException] = None
+    # Shown in the status line while a failed save is retried
+    save_error: Optional[str] = None
+
+    @timed("Tui.getHabits")
     def getHabits(self):
         """
-        Updates the self.completed and self.uncompleted lists.
+        Updates the self.completed and self.uncompleted lists,
+        only including habits of self.filter if set.
+        The lists are only rebuilt if the habits or the filter changed.
         """
         self.habit_tracker.update()
-        self.uncompleted = self.habit_tracker.get_uncompleted_str()
-        self.completed = self.habit_tracker.get_completed_str()
+        key = (self.habit_tracker.version, self.filter)
+        if key == self.lists_for:
+            return
+        self.lists_for = key
+        if self.filter is None:
+            self.setLists(self.habit_tracker.habits)
+        elif self.filter == PeriodLength.weekly:
+            self.setLists(self.habit_tracker.get_weekly())
+        else:
+            self.setLists(self.habit_tracker.get_daily())
+
+    def setLists(self, habits: list[Habit]):
+        """
+        Sets the self.completed and self.uncompleted lists, and their names, to habits.
+        """
+        self.uncompleted = [repr(h) for h in habits if not h.completed]
+        self.completed = [repr(h) for h in habits if h.completed]
+        self.uncompleted_names = [h.name for h in habits if not h.completed]
+        self.completed_names = [h.name for h in habits if h.completed]
+
+    def selected(self) -> Optional[str]:
+        """
+        Returns the name of the habit under the cursor, if there is one.
+        """
+        names = self.uncompleted_names if self.on_todos else self.completed_names
+        if self.cursor < len(names):
+            return names[self.cursor]
+        return None
 
-    def run(self):
+    def run(self, file: str = "habits.org", started: Optional[float] = None,
+            profile_startup: bool = False, backup: bool = False):
         """
-        Run the habit tracker.
+        Run the habit tracker on the org file file.
+
+        Sets up the terminal, paints the home page from a quick summary of the habits,
+        then sets up the habit_tracker on a thread (see load), while keys are already read,
+        and calls draw and input repeatedly.
+        Input waits at most TICK seconds, so rollovers and autosaves
+        also happen while no key is pressed.
 
-        Sets up the habit_tracker and terminal,
-        then calls draw and input repeatedly
+        started is the time.perf_counter() the program was started at,
+        used for first_frame. If profile_startup is set, returns right after the first frame.
+        If backup is set, the previous file is kept as 'bk.<file>' when it is rewritten.
         """
-        self.habit_tracker = HabitTracker(StorageKind.org, "habits.org")
+        if started is None:
+            started = time.perf_counter()
         self.term = Terminal()
-        self.getHabits()
-        for h in self.habit_tracker.habits:
-            log(repr(h))
-        
+        self.renderer = Renderer(self.term)
+        self.viewport = Viewport()
+
         with self.term.fullscreen(), self.term.cbreak():
+            self.drawSummary(file)
+            self.first_frame = time.perf_counter() - started
+            if profile_startup:
+                return
+
+            loader = Thread(target=self.load, args=(file, backup), name="Load", daemon=True)
+            loader.start()
+            keys = self.waitLoaded(loader)
+            if self.load_error is not None:
+                raise self.load_error
+            if self.quit:
+                return
+            self.storage = BackgroundStorage(self.habit_tracker.storage)
+            self.habit_tracker.storage = self.storage
+            self.saved_version = self.changed_version = self.habit_tracker.version
+            self.changed_at = time.monotonic()
+            self.getHabits()
+            if ENABLED:
+                for h in self.habit_tracker.habits:
+                    debug("%r", h)
+
+            # Keys pressed while loading
+            for key in keys:
+                if self.quit:
+                    break
+                self.draw()
+                self.input(key)
             while not self.quit:
                 self.draw()
                 self.input()
-
+                self.autosave()
+        # Wait for the last writes
+        self.storage.close()
+        e = self.storage.take_error()
+        if e is not None:
+            sys.exit(f"Saving failed, the last changes may be lost: {e}")
+
+    @timed("Tui.draw")
     def draw(self):
         """
         Draw the Tui once.
@@ -129,21 +395,118 @@ class Tui:
             self.drawHomepage()
         elif self.page == TuiPage.analytics:
             self.drawAnalytics()
+        elif self.page == TuiPage.history:
+            self.drawHistory()
+        elif self.page == TuiPage.debug:
+            self.drawDebug()
         else:
             self.drawInfopage()
 
-    def input(self):
+    def load(self, file: str, backup: bool):
         """
-        Handle one input.
+        Reads in the habits of file into self.habit_tracker, run on a thread behind the first frame.
+        Only the headers are read, histories are read when needed (see HabitTracker.lazy).
         """
-        inp = self.term.inkey().lower()
+        try:
+            self.habit_tracker = HabitTracker(StorageKind.org, file, journal=True, lazy=True,
+                                              backup=backup, cache=True)
+        except BaseException as e:
+            # Also SystemExit, which would only end the thread
+            self.load_error = e
+
+    def waitLoaded(self, loader: Thread) -> list[Keystroke]:
+        """
+        Waits for loader while handling input: 'q' quits right away,
+        other keys are returned, to be handled once the habits are read in.
+        """
+        keys: list[Keystroke] = []
+        while loader.is_alive():
+            key = self.term.inkey(timeout=LOAD_POLL)
+            if key == '':
+                continue
+            if key.lower() == 'q':
+                self.quit = True
+                break
+            keys.append(key)
+        return keys
+
+    def input(self, key: Optional[Keystroke] = None):
+        """
+        Handle one input (key, or the next key pressed),
+        or tick if there was none for TICK seconds.
+        """
+        if key is None:
+            key = self.term.inkey(timeout=TICK)
+        if key == '':
+            self.tick()
+            return
+        if key.is_sequence and key.name in NAMED_KEYS:
+            inp = key.name.lower()
+        else:
+            inp = key.lower()
         # log("input: " + inp)
-        if self.page == TuiPage.analytics:
-            self.analyticsInput(inp)
-        elif self.page == TuiPage.homepage:
-            self.homepageInput(inp)
+        # Only the handling is timed, not waiting for the key
+        with Span("Tui.input"):
+            if inp == 'p':
+                self.toggleDebug()
+            elif self.page == TuiPage.analytics:
+                self.analyticsInput(inp)
+            elif self.page == TuiPage.history:
+                self.historyInput(inp)
+            elif self.page == TuiPage.homepage:
+                self.homepageInput(inp)
+            elif self.page == TuiPage.debug:
+                self.debugInput(inp)
+            else:
+                self.infoInput(inp)
+
+    def toggleDebug(self):
+        """
+        Opens the debug page, or goes back to the page it was opened from.
+        """
+        if self.page == TuiPage.debug:
+            self.page = self.previous
         else:
-            self.infoInput(inp)
+            self.previous = self.page
+            self.page = TuiPage.debug
+
+    def tick(self):
+        """
+        Applies day/week rollovers and flushes the log, called when idle.
+        """
+        self.habit_tracker.update()
+        flush_due()
+
+    def save(self):
+        """
+        Saves the habits in the background.
+        """
+        self.habit_tracker.save()
+        self.saved_version = self.habit_tracker.version
+
+    def autosave(self):
+        """
+        Saves the habits in the background once they have not changed for AUTOSAVE_DELAY seconds.
+        Many changes in a row thus only lead to a single save.
+        If a background write failed, it is shown in the status line
+        and the habits are saved again AUTOSAVE_DELAY seconds later.
+        """
+        version = self.habit_tracker.version
+        now = time.monotonic()
+        e = self.storage.take_error()
+        if e is not None:
+            warning("Saving failed: %r", e)
+            self.save_error = f"Saving failed, retrying: {e}"
+            # Not saved after all
+            self.saved_version = -1
+            self.changed_at = now
+        elif self.save_error is not None and self.saved_version == version and self.storage.idle():
+            self.save_error = None
+        if version != self.changed_version:
+            self.changed_version = version
+            self.changed_at = now
+        if version != self.saved_version and now - self.changed_at >= AUTOSAVE_DELAY:
+            self.save()
 
     def get_str(self, prompt: str) -> str:
         """
@@ -153,6 +516,7 @@ class Tui:
         # log("Getting str.")
         while True:
             print(self.term.move_xy(0, self.term.height - 1) + self.term.clear_eol() + prompt + s, end='', flush=True)
+            self.renderer.invalidate(self.term.height - 1)
             ch = self.term.getch()
             # Enter
             if ch == '\n':
@@ -184,6 +548,7 @@ class Tui:
         # log("Confirming...")
         while True:
             print(self.term.move_xy(0, self.term.height - 1) + self.term.clear_eol() + prompt + " [y/n] ", end='', flush=True)
+            self.renderer.invalidate(self.term.height - 1)
             match self.term.getch().lower():
                 case "y":
                     return True
@@ -195,6 +560,7 @@ class Tui:
         Helper function to warn the user.
         """
         print(self.term.move_xy(0, self.term.height - 1) + self.term.clear_eol() + warning, end='', flush=True)
+        self.renderer.invalidate(self.term.height - 1)
 
     def analyticsInput(self, inp: str):
         """
@@ -203,17 +569,48 @@ class Tui:
         match inp:
             case 'q':
                 self.quit = True
-                self.habit_tracker.save()
+                self.save()
+            case 'o':
+                debug("Pressed 'o'")
+                self.habit_tracker.read()
+                self.getHabits()
+            case 's':
+                debug("Pressed 's'")
+                self.save()
+            case '\t':
+                self.page = TuiPage.history
+            case ' ' | '\n':
+                self.page = TuiPage.homepage
+
+    def historyInput(self, inp: str):
+        """
+        The inputs for the history page.
+        """
+        match inp:
+            case 'q':
+                self.quit = True
+                self.save()
             case 'o':
-                log("Pressed 'o'")
+                debug("Pressed 'o'")
                 self.habit_tracker.read()
                 self.getHabits()
             case 's':
-                log("Pressed 's'")
-                self.habit_tracker.save()
+                debug("Pressed 's'")
+                self.save()
             case ' ' | '\t' | '\n':
                 self.page = TuiPage.homepage
 
+    def debugInput(self, inp: str):
+        """
+        The inputs for the debug page.
+        """
+        match inp:
+            case 'q':
+                self.quit = True
+                self.save()
+            case ' ' | '\t' | '\n':
+                self.toggleDebug()
+
     def homepageInput(self, inp: str):
         """
         The inputs for the home page.
@@ -221,14 +618,14 @@ class Tui:
         match inp:
             case 'q':
                 self.quit = True
-                self.habit_tracker.save()
+                self.save()
             case 'o':
-                log("Pressed 'o'")
+                debug("Pressed 'o'")
                 self.habit_tracker.read()
                 self.getHabits()
             case 's':
-                log("Pressed 's'")
-                self.habit_tracker.save()
+                debug("Pressed 's'")
+                self.save()
             case 'h' | 'l' | 'key_right' | 'key_left':
                 self.on_todos = not self.on_todos
                 # log("On Todo: " + repr(self.on_todos))
@@ -247,10 +644,23 @@ class Tui:
             case 'k' | 'key_up':
                 if self.cursor > 0:
                     self.cursor -= 1
+            case 'key_pgdown' | 'key_pgup' | 'key_home' | 'key_end' | '<' | '>':
+                if self.on_todos:
+                    last = max(len(self.uncompleted) - 1, 0)
+                else:
+                    last = max(len(self.completed) - 1, 0)
+                if inp == 'key_pgdown':
+                    self.cursor = min(self.cursor + self.viewport.height, last)
+                elif inp == 'key_pgup':
+                    self.cursor = max(self.cursor - self.viewport.height, 0)
+                elif inp in ('key_home', '<'):
+                    self.cursor = 0
+                else:
+                    self.cursor = last
             case '\n':
                 # log("Pressed enter.")
                 if self.on_todos and len(self.uncompleted) > 0:
-                    self.habit_tracker.complete(self.uncompleted[self.cursor])
+                    self.habit_tracker.complete(self.uncompleted_names[self.cursor])
                     if self.cursor > 0:
                         self.cursor -= 1
                 self.getHabits()
@@ -269,12 +679,12 @@ class Tui:
                     if not self.confirm(f"Are you sure you want to delete '{self.uncompleted[self.cursor]}'"):
                         return
                     # log(f"Deleting {self.uncompleted[self.cursor]}...")
-                    toDelete = self.uncompleted[self.cursor]
+                    toDelete = self.uncompleted_names[self.cursor]
                 elif not self.on_todos and len(self.completed) > 0:
                     if not self.confirm(f"Are you sure you want to delete '{self.completed[self.cursor]}'"):
                         return
                     # log(f"Deleting {self.completed[self.cursor]}...")
-                    toDelete = self.uncompleted[self.cursor]
+                    toDelete = self.completed_names[self.cursor]
                 self.habit_tracker.deleteHabit(toDelete)
                 self.getHabits()
                 if self.cursor > 0:
@@ -304,88 +714,164 @@ class Tui:
         match inp:
             case 'q':
                 self.quit = True
-                self.habit_tracker.save()
+                self.save()
             case 'o':
-                log("Pressed 'o'")
+                debug("Pressed 'o'")
                 self.habit_tracker.read()
                 self.getHabits()
             case 's':
-                log("Pressed 's'")
-                self.habit_tracker.save()
+                debug("Pressed 's'")
+                self.save()
             case ' ' | '\t' | '\n':
                 self.page = TuiPage.homepage
 
-    def drawHeader(self):
+    def drawHeader(self) -> str:
         """
-        Draws the header.
+        Returns the header line.
         """
+        tabs = " ".join("[" + p + "]" if p == self.page else p
+                        for p in (TuiPage.homepage, TuiPage.analytics, TuiPage.history))
         if self.page == TuiPage.homepage:
-            print(self.term.clear() + self.term.home() + "[" + TuiPage.homepage + "] " + TuiPage.analytics)
-        else:
-            print(self.term.clear() + self.term.home() + ' ' + TuiPage.homepage + " [" + TuiPage.analytics + "]")
+            return tabs
+        return ' ' + tabs
+
+    def drawSummary(self, file: str):
+        """
+        Draws the home page from OrgStorage.iter_summary of file,
+        before the habits are read in completely.
+        Only the habits up to the last row on screen are read.
+        """
+        # As many rows as drawTable shows
+        rows = max(self.term.height - 4, 1)
+        current = current_periods()
+        uncompleted: list[Habit] = []
+        completed: list[Habit] = []
+        for h in OrgStorage(file, journal=True, cache=True).iter_summary():
+            rollover(h, current)
+            (completed if h.completed else uncompleted).append(h)
+            if len(uncompleted) >= rows and len(completed) >= rows:
+                break
+        self.setLists(uncompleted + completed)
+        self.drawTable()
 
     def drawHomepage(self):
         """
         Draws the home page.
         """
-        if self.filter is None:
-            self.getHabits()
-        else:
-            get_habits = self.habit_tracker.get_daily
-            if self.filter == PeriodLength.weekly:
-                get_habits = self.habit_tracker.get_weekly
-            self.uncompleted = [repr(h) for h in get_habits() if not h.completed]
-            self.completed = [repr(h) for h in get_habits() if h.completed]
-
-        with self.term.hidden_cursor():
-            self.drawHeader()
-            printTable(self.term, self.uncompleted, self.completed)
-            self.warn(f"Filtering: {self.filter}")
+        self.getHabits()
+        self.drawTable()
+
+    @timed("Tui.drawTable")
+    def drawTable(self):
+        """
+        Draws the home page with the current self.uncompleted and self.completed lists.
+        """
+        # Header, table header and divider at the top, status line at the bottom
+        self.viewport.height = max(self.term.height - 4, 1)
+        self.viewport.follow(self.cursor, max(len(self.uncompleted), len(self.completed)))
+        lines = [self.drawHeader()]
+        lines += formatTable(self.term, self.viewport.visible(self.uncompleted),
+                             self.viewport.visible(self.completed))
+        lines += [""] * (self.term.height - 1 - len(lines))
+        status = f"Filtering: {self.filter}"
+        if self.save_error is not None:
+            status += f" | {self.save_error}"
+        lines.append(status)
         if self.on_todos: 
             cursor_x = 0
         else: 
             cursor_x = self.term.width // 2
         # log("cursor: " + repr(cursor_x) + ", " + repr(self.cursor))
-        print(self.term.move_yx(self.cursor + 3, cursor_x), end='', flush=True)
+        self.renderer.render(lines, (self.cursor - self.viewport.offset + 3, cursor_x))
 
     def drawAnalytics(self):
         """
         Draws the analytics page.
         """
-        with self.term.hidden_cursor():
-            self.drawHeader()
-            print(f"Total number of habits: {len(self.habit_tracker.habits)}")
-            print(f"Completed habits: {len(self.completed)}")
-            print(f"Daily habits: {self.habit_tracker.nrDailyHabits()}")
-            print(f"Weekly habits: {self.habit_tracker.nrWeeklyHabits()}")
-            print("")
-
-            print(f"Current longest streak: {self.habit_tracker.currentLongestStreak()}")
-            print(f"Current longest daily habit streak: {self.habit_tracker.currentLongestDailyStreak()}")
-            print(f"Current longest weekly habit streak: {self.habit_tracker.currentLongestWeeklyStreak()}")
-            print("")
-
-            print(f"Longest ever streak: {self.habit_tracker.longestEverStreak()}")
-            print(f"Longest ever daily habit streak: {self.habit_tracker.longestEverDailyStreak()}")
-            print(f"Longest ever weekly habit streak: {self.habit_tracker.longestEverWeeklyStreak()}")
+        # Cached by the habit tracker, so redrawing without changes is cheap
+        a = self.habit_tracker.analytics()
+        top = ", ".join(f"{h.name}: {h.streak_length}" for h in self.habit_tracker.topStreaks(3))
+        top_ever = ", ".join(f"{h.name}: {lstreak(h)}" for h in self.habit_tracker.topLongestStreaks(3))
+        self.renderer.render([
+            self.drawHeader(),
+            f"Total number of habits: {a.total}",
+            f"Completed habits: {a.completed}",
+            f"Daily habits: {a.daily}",
+            f"Weekly habits: {a.weekly}",
+            "",
+            f"Current longest streak: {self.habit_tracker.currentLongestStreak()}",
+            f"Current longest daily habit streak: {self.habit_tracker.currentLongestDailyStreak()}",
+            f"Current longest weekly habit streak: {self.habit_tracker.currentLongestWeeklyStreak()}",
+            "",
+            f"Longest ever streak: {self.habit_tracker.longestEverStreak()}",
+            f"Longest ever daily habit streak: {self.habit_tracker.longestEverDailyStreak()}",
+            f"Longest ever weekly habit streak: {self.habit_tracker.longestEverWeeklyStreak()}",
+            "",
+            f"Top current streaks: {top}",
+            f"Top streaks ever: {top_ever}",
+        ])
+
+    def drawHistory(self):
+        """
+        Draws the history page.
+        """
+        # Cached by the habit tracker, only recomputed on changes
+        hist = self.habit_tracker.history(WEEKS)
+        lines = [self.drawHeader(), f"Completion rate per week (last {WEEKS} weeks):"]
+        for k, rate in enumerate(hist.week_rates):
+            monday = from_epoch((hist.first_day + 7 * k) * DAY).date()
+            lines.append(f"{monday}  {bar(rate, 20)}  {percent(rate)}")
+        best = hist.best_weekday()
+        lines.append("")
+        lines.append("Best day of the week: " + ("None" if best is None else
+                     f"{WEEKDAYS[best]} ({hist.weekday_counts[best]} completions)"))
+        lines.append("")
+        lines.append("Completion rate per habit:")
+        ranked = sorted(range(len(hist.habits)), key=lambda i: -(hist.habit_rates[i] or 0))
+        for i in ranked[:max(self.term.height - len(lines), 0)]:
+            lines.append(f"{percent(hist.habit_rates[i])}  {hist.habits[i].name}")
+        self.renderer.render(lines)
+
+    def drawDebug(self):
+        """
+        Draws the debug page, the latencies of the timed spans (see timing)
+        and the most recent log records if logging is on.
+        """
+        lines = ["[" + self.page + "]", "",
+                 f"{'Span':<24} {'Count':>7} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"]
+        for name, s in summary().items():
+            line = f"{name:<24} {s['count']:>7} {s['p50_ms']:>9.3f} {s['p95_ms']:>9.3f} {s['max_ms']:>9.3f}"
+            if "alloc_bytes" in s:
+                line += f"  alloc {s['alloc_bytes'] / 1024:.1f} KiB, peak {s['peak_bytes'] / 1024:.1f} KiB"
+            lines.append(line)
+        if ENABLED:
+            lines.append("")
+            room = max(self.term.height - len(lines), 0)
+            lines += records()[-room:] if room else []
+        self.renderer.render(lines)
 
     def drawInfopage(self):
         """
         Draws the habit info page.
         """
-        if self.on_todos and self.cursor < len(self.uncompleted):
-            h = self.habit_tracker.getHabit(self.uncompleted[self.cursor])
-        elif not self.on_todos and self.cursor < len(self.completed):
-            h = self.habit_tracker.getHabit(self.completed[self.cursor])
+        name = self.selected()
+        if name is not None:
+            h = self.habit_tracker.getHabit(name)
         else:
             self.page = TuiPage.homepage
             self.draw()
             return
         if h is None:
             sys.exit("Unreachable: Got None when trying to get habit for info page.")
-        print(self.term.clear() + self.term.home() + "[" + self.page + "]")
-        print()
-        print(h)
-        print("Completed at:")
-        for ct in h.completed_times:
-            print(f"- [{str(ct)}]")
+        lines = ["[" + self.page + "]", ""]
+        lines += str(h).split("\n")
+        lines.append(f"Last {WEEKS} weeks:")
+        grid = self.habit_tracker.heatmap(h, WEEKS)
+        for d in range(7):
+            lines.append(WEEKDAYS[d][:3] + " " + "".join(HEAT[min(week[d], len(HEAT) - 1)] for week in grid))
+        lines.append("Completed at:")
+        # Only format the most recent ones that fit on screen
+        rows = max(self.term.height - len(lines), 0)
+        for ct in h.completed_times[-rows:] if rows else []:
+            lines.append(f"- [{str(ct)}]")
+        self.renderer.render(lines)